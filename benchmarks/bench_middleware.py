@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the splash middleware hot path.
+
+Runs `SplashMiddleware.process_request` against a throwaway test database
+(`test_settings`, sqlite and locmem cache) for a set of scenarios, and reports
+the throughput, the per-call latency and the number of queries per call.
+
+Usage:
+
+    python benchmarks/bench_middleware.py [--iterations N] [--json] [SCENARIO ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+
+import django  # pylint: disable=wrong-import-position
+
+django.setup()
+
+# pylint: disable=wrong-import-position
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils.functional import SimpleLazyObject
+
+from splash.middleware import SplashMiddleware
+from splash.models import SplashConfig
+from splash.snapshot import invalidate_snapshot
+
+User = get_user_model()
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """
+    Register a scenario: a function saving a configuration and returning a request factory callable
+    """
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def lazy_user(username):
+    """
+    Return a function building lazily loaded users, like the one `AuthenticationMiddleware` sets on requests
+    """
+    user_id = User.objects.get_or_create(username=username)[0].pk
+    return lambda: SimpleLazyObject(lambda: User.objects.get(pk=user_id))
+
+
+def build_request(url_path='/somewhere', cookies=None, user=AnonymousUser):
+    """
+    Return a function building requests with the given attributes
+    """
+    request_factory = RequestFactory(SERVER_NAME='example.org')
+
+    def build():
+        request = request_factory.get(url_path)
+        request.user = user()
+        if cookies is not None:
+            request.COOKIES = cookies
+        return request
+    return build
+
+
+@scenario('disabled')
+def disabled():
+    """The splash screen is disabled"""
+    SplashConfig(enabled=False).save()
+    return build_request()
+
+
+@scenario('exempt-path')
+def exempt_path():
+    """The path is unaffected"""
+    SplashConfig(enabled=True, unaffected_url_paths='/heartbeat,/api/*,/*/xblock/*').save()
+    return build_request(url_path='/courses/xblock/handler')
+
+
+@scenario('exempt-user')
+def exempt_user():
+    """The user is unaffected"""
+    SplashConfig(enabled=True, unaffected_usernames='staff,user1,user2').save()
+    return build_request(user=lazy_user('staff'))
+
+
+@scenario('valid-cookie')
+def valid_cookie():
+    """The request has an allowed cookie value"""
+    SplashConfig(enabled=True, unaffected_usernames='staff').save()
+    return build_request(cookies={'edx_splash_screen': 'seen'}, user=lazy_user('student'))
+
+
+@scenario('redirect')
+def redirect():
+    """The request is redirected"""
+    SplashConfig(enabled=True).save()
+    return build_request()
+
+
+@scenario('redirect-1k-paths')
+def redirect_1k_paths():
+    """The request is redirected, after checking 1,000 unaffected paths"""
+    paths = ','.join(f'/api/v1/namespace{i}/*' for i in range(1000))
+    SplashConfig(enabled=True, unaffected_url_paths=paths).save()
+    return build_request()
+
+
+def exempt_path_among(count):
+    """
+    Register a scenario where the path is exempted by the last of `count` unaffected paths
+    """
+    @scenario(f'exempt-path-among-{count}')
+    def exempt_path_among_count():
+        paths = ','.join(f'/api/v1/namespace{i}/*' for i in range(count))
+        SplashConfig(enabled=True, unaffected_url_paths=paths).save()
+        return build_request(url_path=f'/api/v1/namespace{count - 1}/resource')
+    exempt_path_among_count.__doc__ = f"The path is exempted by the last of {count} unaffected paths"
+
+
+for _count in (10, 100, 1000, 10000):
+    exempt_path_among(_count)
+
+
+@scenario('redirect-10k-usernames')
+def redirect_10k_usernames():
+    """The request is redirected, after checking 10,000 unaffected usernames"""
+    usernames = ','.join(f'user{i}' for i in range(10000))
+    SplashConfig(enabled=True, unaffected_usernames=usernames).save()
+    return build_request(user=lazy_user('student'))
+
+
+@scenario('rollout-sampled-out')
+def rollout_sampled_out():
+    """The visitor is outside a partial rollout"""
+    SplashConfig(enabled=True, rollout_percentage=1).save()
+    return build_request(cookies={'sessionid': 'a-session-key'})
+
+
+def run_scenario(name, iterations):
+    """
+    Run the scenario `name`, returning its measurements
+    """
+    SplashConfig.objects.all().delete()
+    build = SCENARIOS[name]()
+    invalidate_snapshot()
+    middleware = SplashMiddleware(lambda request: None)
+
+    # Warm up, so that the first configuration fetch isn't measured
+    middleware.process_request(build())
+
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(100):
+            middleware.process_request(build())
+    queries_per_call = len(queries) / 100
+
+    requests = [build() for _ in range(iterations)]
+    latencies = []
+    process_request = middleware.process_request
+    perf_counter_ns = time.perf_counter_ns
+    started = perf_counter_ns()
+    for request in requests:
+        call_started = perf_counter_ns()
+        process_request(request)
+        latencies.append(perf_counter_ns() - call_started)
+    elapsed = (perf_counter_ns() - started) / 1e9
+
+    latencies.sort()
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'requests_per_second': iterations / elapsed,
+        'mean_us': statistics.mean(latencies) / 1000,
+        'p50_us': latencies[len(latencies) // 2] / 1000,
+        'p99_us': latencies[int(len(latencies) * 0.99)] / 1000,
+        'queries_per_call': queries_per_call,
+    }
+
+
+def main():
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help=f"Scenarios to run (default: all). Choices: {', '.join(SCENARIOS)}")
+    parser.add_argument('--iterations', type=int, default=10000, help='Calls measured per scenario')
+    parser.add_argument('--decision-cache-size', type=int, default=0,
+                        help='Value of the SPLASH_DECISION_CACHE_SIZE setting')
+    parser.add_argument('--json', action='store_true', help='Output the results as JSON lines')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    settings.SPLASH_DECISION_CACHE_SIZE = args.decision_cache_size
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = [run_scenario(name, args.iterations) for name in args.scenarios or SCENARIOS]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"{'scenario':<24}{'req/s':>12}{'mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}{'queries':>9}")
+    for result in results:
+        print(
+            f"{result['scenario']:<24}{result['requests_per_second']:>12,.0f}{result['mean_us']:>10.2f}"
+            f"{result['p50_us']:>10.2f}{result['p99_us']:>10.2f}{result['queries_per_call']:>9.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
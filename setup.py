@@ -46,6 +46,14 @@ setup(
     install_requires=[
         "Django<5.0"
     ],
+    extras_require={
+        # For the YAML format of the splash_import_exemptions command
+        "yaml": ["PyYAML"],
+        # For splash.invalidation.RedisInvalidationBackend
+        "redis": ["redis"],
+        # For brotli compression of splash.landing pages
+        "brotli": ["brotli"],
+    },
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords='Django edx',
@@ -5,8 +5,9 @@ Admin site bindings for splash screen
 
 from django.contrib import admin
 
-from config_models.admin import ConfigurationModelAdmin
+from config_models.admin import ConfigurationModelAdmin, KeyedConfigurationModelAdmin
 
-from splash.models import SplashConfig
+from splash.models import SiteSplashConfig, SplashConfig
 
 admin.site.register(SplashConfig, ConfigurationModelAdmin)
+admin.site.register(SiteSplashConfig, KeyedConfigurationModelAdmin)
@@ -0,0 +1,119 @@
+"""
+Splash screen - Bloom filter
+
+Compact probabilistic set of strings: a value which was added is always
+reported as present, and a value which wasn't is reported as present with a
+small probability (`DEFAULT_ERROR_RATE`). Used as a prefilter in front of an
+exact lookup of long username lists.
+
+The bits are held in a bytes buffer, which can be saved to a file and mapped
+read-only in memory, so that all the workers of a host share a single copy.
+Files are saved with a key identifying what they were built from, checked
+when they're loaded, so that a file built from other values isn't used.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+
+DEFAULT_ERROR_RATE = 0.001
+
+# Magic, number of bits, number of hash functions, key
+HEADER = struct.Struct('<4sQI16s')
+MAGIC = b'SPLB'
+KEY_SIZE = 16
+
+
+class BloomFilterError(ValueError):
+    """
+    A file doesn't hold a valid Bloom filter
+    """
+
+
+def hash_pair(value):
+    """
+    Return two independent 64-bit hashes of the string `value`
+    """
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class BloomFilter:
+    """
+    Bloom filter over the `num_bits` bits of the buffer `bits`, using `num_hashes` hash functions
+    """
+
+    def __init__(self, bits, num_bits, num_hashes):
+        self.bits = bits
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+
+    @classmethod
+    def build(cls, values, count, error_rate=DEFAULT_ERROR_RATE):
+        """
+        Build a filter of the `count` strings of the iterable `values`, with a false positive rate of `error_rate`
+        """
+        count = max(count, 1)
+        num_bits = max(8, math.ceil(-count * math.log(error_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / count * math.log(2)))
+        bloom_filter = cls(bytearray((num_bits + 7) // 8), num_bits, num_hashes)
+        for value in values:
+            bloom_filter.add(value)
+        return bloom_filter
+
+    def positions(self, value):
+        """
+        Yield the positions of the bits of `value`, by enhanced double hashing
+        """
+        position, step = hash_pair(value)
+        for index in range(self.num_hashes):
+            yield position % self.num_bits
+            position += step
+            step += index
+
+    def add(self, value):
+        """
+        Add the string `value` to the filter, which must be backed by a mutable buffer
+        """
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+    def save(self, path, key=b''):
+        """
+        Write the filter to `path` with the `key` (up to `KEY_SIZE` bytes) identifying
+        what it was built from, atomically so that readers never see a partial file
+        """
+        directory = os.path.dirname(path) or '.'
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                output.write(HEADER.pack(MAGIC, self.num_bits, self.num_hashes, key))
+                output.write(self.bits)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, path, key=b''):
+        """
+        Map the filter saved in `path` with `key` read-only in memory
+        """
+        with open(path, 'rb') as input_file:
+            # Empty files can't be mapped
+            if os.fstat(input_file.fileno()).st_size < HEADER.size:
+                raise BloomFilterError(f'{path} is too short to hold a Bloom filter')
+            mapped = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_bits, num_hashes, saved_key = HEADER.unpack_from(mapped)
+        if magic != MAGIC or len(mapped) - HEADER.size != (num_bits + 7) // 8 or not num_hashes:
+            raise BloomFilterError(f'{path} does not hold a valid Bloom filter')
+        if saved_key != key.ljust(KEY_SIZE, b'\0'):
+            raise BloomFilterError(f'{path} was built from other values')
+        return cls(memoryview(mapped)[HEADER.size:], num_bits, num_hashes)
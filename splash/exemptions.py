@@ -0,0 +1,74 @@
+"""
+Splash screen - Validation of exemption lists
+
+Exemption lists are stored as comma-separated values in the configuration
+models. These helpers validate and normalize lists of values before they're
+joined into a configuration.
+"""
+import re
+
+from .models import EXEMPTION_MAX_LENGTH
+
+COOKIE_VALUE_FORBIDDEN_CHARACTERS = re.compile(r'[\s";\\]')
+WHITESPACE = re.compile(r'\s')
+
+
+def validation_error(field, value):
+    """
+    Return why `value` can't be stored in the exemption list `field`, or None if it can
+    """
+    if ',' in value:
+        return 'contains a comma'
+    if len(value) > EXEMPTION_MAX_LENGTH:
+        return f'is longer than {EXEMPTION_MAX_LENGTH} characters'
+    if field == 'unaffected_url_paths':
+        if not value.startswith(('/', '*')):
+            return 'does not start with / or *'
+        if WHITESPACE.search(value):
+            return 'contains whitespace'
+    elif field == 'unaffected_usernames' and WHITESPACE.search(value):
+        return 'contains whitespace'
+    elif field == 'cookie_allowed_values' and COOKIE_VALUE_FORBIDDEN_CHARACTERS.search(value):
+        return 'contains characters not allowed in cookie values'
+    return None
+
+
+class NormalizedExemptions:
+    """
+    Validated, stripped and deduplicated values of an exemption list `field`
+
+    Values are added with `add`; the accepted ones are kept in order in
+    `values`, the rejected ones in `rejected` as (value, reason) pairs.
+    """
+
+    def __init__(self, field, values=()):
+        self.field = field
+        self.values = []
+        self.rejected = []
+        self.duplicates = 0
+        self._seen = set()
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """
+        Validate and add `value`
+        """
+        value = value.strip()
+        if not value:
+            return
+        if value in self._seen:
+            self.duplicates += 1
+            return
+        error = validation_error(self.field, value)
+        if error is not None:
+            self.rejected.append((value, error))
+            return
+        self._seen.add(value)
+        self.values.append(value)
+
+    def as_field_value(self):
+        """
+        Return the values joined into the comma-separated field value
+        """
+        return ','.join(self.values)
@@ -0,0 +1,29 @@
+"""
+Splash screen - Instrumentation
+
+Setting `SPLASH_INSTRUMENTATION` to a callable, or to its dotted path, lets
+`SplashMiddleware` report what it does. The callable is called as
+`hook(metric, value, tags)`, for instance to forward the values to StatsD or
+Prometheus:
+
+* `splash.config_fetch`: seconds spent getting the configuration, tagged with
+  its `source` (`snapshot`, `shared`, `cache` or `db`)
+* `splash.decision`: seconds spent deciding on the request, tagged with the
+  `outcome` (`disabled`, `exempt-path`, `exempt-user`, `cookie-ok`,
+  `redirect-url`, `sampled-out` or `redirect`)
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+CONFIG_FETCH = 'splash.config_fetch'
+DECISION = 'splash.decision'
+
+
+def get_instrumentation_hook():
+    """
+    Return the callable configured in `SPLASH_INSTRUMENTATION`, or None
+    """
+    hook = getattr(settings, 'SPLASH_INSTRUMENTATION', None)
+    if isinstance(hook, str):
+        hook = import_string(hook)
+    return hook
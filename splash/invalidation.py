@@ -0,0 +1,195 @@
+"""
+Splash screen - Invalidation channel
+
+When `SPLASH_INVALIDATION_BACKEND` is set to the dotted path of an
+`InvalidationBackend` (with the keyword arguments in
+`SPLASH_INVALIDATION_OPTIONS`), saving a configuration revision publishes a
+message on its channel, and every process subscribed to it drops its
+snapshots. Processes then keep their snapshots until they're notified, instead
+of checking for new revisions every `SPLASH_CONFIG_CHECK_INTERVAL` seconds.
+
+Backends:
+
+* `RedisInvalidationBackend`: Redis pub/sub, across hosts (requires `redis`)
+* `SocketInvalidationBackend`: Unix datagram sockets in a directory, for the
+  processes of a host
+* `FileInvalidationBackend`: a file replaced on each revision and watched by
+  the subscribers, mostly for tests and development
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+log = logging.getLogger(__name__)
+
+SUBSCRIBE_TIMEOUT = 5
+
+
+class InvalidationBackend:
+    """
+    Channel notifying the processes of new configuration revisions
+    """
+
+    def publish(self, message):
+        """
+        Notify the subscribers with the string `message`
+        """
+        raise NotImplementedError
+
+    def listen(self, callback, ready):
+        """
+        Call `callback(message)` for each message, forever, setting the event
+        `ready` once no message can be missed. Runs in a daemon thread.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, callback):
+        """
+        Start calling `callback(message)` for each message from a daemon thread, and return the thread
+
+        Waits for the listener to be ready (for up to `SUBSCRIBE_TIMEOUT`
+        seconds), so that the messages published once this returns aren't missed.
+        """
+        ready = threading.Event()
+
+        def listen():
+            while True:
+                try:
+                    self.listen(callback, ready)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception('Splash invalidation listener failed, restarting')
+                    # Messages may have been missed meanwhile
+                    callback('')
+                    time.sleep(1)
+
+        thread = threading.Thread(target=listen, name='splash-invalidation', daemon=True)
+        thread.start()
+        if not ready.wait(SUBSCRIBE_TIMEOUT):
+            log.warning('Splash invalidation listener not ready after %s seconds', SUBSCRIBE_TIMEOUT)
+        return thread
+
+
+class RedisInvalidationBackend(InvalidationBackend):
+    """
+    Redis pub/sub on `channel` of the server at `url`
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', channel='splash-invalidation'):
+        try:
+            import redis  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError('RedisInvalidationBackend requires redis to be installed') from error
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, message):
+        self.client.publish(self.channel, message)
+
+    def listen(self, callback, ready):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        ready.set()
+        for item in pubsub.listen():
+            callback(item['data'].decode('utf-8', 'replace'))
+
+
+class SocketInvalidationBackend(InvalidationBackend):
+    """
+    Unix datagram sockets in `directory`: each subscribed process binds one, and
+    messages are sent to all of them
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def publish(self, message):
+        data = message.encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            for name in os.listdir(self.directory):
+                if not name.endswith('.sock'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a process which exited
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+    def listen(self, callback, ready):
+        path = os.path.join(self.directory, f'{os.getpid()}-{threading.get_ident()}.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as receiver:
+            if os.path.exists(path):
+                os.unlink(path)
+            receiver.bind(path)
+            ready.set()
+            try:
+                while True:
+                    callback(receiver.recv(4096).decode('utf-8', 'replace'))
+            finally:
+                os.unlink(path)
+
+
+class FileInvalidationBackend(InvalidationBackend):
+    """
+    The file at `path`, replaced with each message, and checked by the subscribers every `poll_interval` seconds
+    """
+
+    def __init__(self, path, poll_interval=1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def publish(self, message):
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as output:
+                output.write(message)
+            # A new inode each time, so that every message is noticed
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+
+    def listen(self, callback, ready):
+        last_version = self.version()
+        ready.set()
+        while True:
+            time.sleep(self.poll_interval)
+            version = self.version()
+            if version != last_version:
+                last_version = version
+                try:
+                    with open(self.path, encoding='utf-8') as input_file:
+                        message = input_file.read()
+                except FileNotFoundError:
+                    message = ''
+                callback(message)
+
+    def version(self):
+        """
+        Return what identifies the current content of the file
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+
+def get_invalidation_backend():
+    """
+    Return the backend configured in `SPLASH_INVALIDATION_BACKEND`, or None
+    """
+    backend = getattr(settings, 'SPLASH_INVALIDATION_BACKEND', None)
+    if not backend:
+        return None
+    return import_string(backend)(**getattr(settings, 'SPLASH_INVALIDATION_OPTIONS', {}))
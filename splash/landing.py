@@ -0,0 +1,145 @@
+"""
+Splash screen - Landing page served in-process
+
+When a configuration has `landing_page` enabled, the middleware answers the
+requests it would redirect with its landing page instead, saving visitors a
+round trip. The page is rendered from `landing_template` once per
+configuration revision, when its snapshot is built, and compressed ahead of
+time with gzip (and brotli, if the `brotli` package is installed). Each
+encoding gets a strong ETag derived from the rendered page, so that repeat
+visits get a 304. Serving the page only picks an encoding and copies bytes.
+"""
+import gzip
+import hashlib
+import logging
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.urls import NoReverseMatch, reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# Content codings, by order of preference
+BROTLI = 'br'
+GZIP = 'gzip'
+IDENTITY = 'identity'
+
+
+@lru_cache(maxsize=64)
+def accepted_encodings(accept_encoding):
+    """
+    Return the content codings accepted by the `Accept-Encoding` header value `accept_encoding`
+
+    A wildcard stands for the codings the header doesn't list, so that an explicit `q=0` still refuses one.
+    """
+    accepted = set()
+    listed = set()
+    for item in accept_encoding.lower().split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        listed.add(coding)
+        if coding and quality > 0:
+            accepted.add(coding)
+    if '*' in accepted:
+        accepted.update(coding for coding in (BROTLI, GZIP) if coding not in listed)
+    return frozenset(accepted)
+
+
+def render_body(config):
+    """
+    Render the landing page template of `config` into bytes, raising whatever rendering it raises
+    """
+    accept_url = None
+    if config.signed_cookie:
+        try:
+            accept_url = f"{reverse('splash:accept')}?{urlencode({'next': '/'})}"
+        except NoReverseMatch:
+            pass
+    context = {
+        'message': config.landing_message,
+        'redirect_url': config.redirect_url,
+        'accept_url': accept_url,
+    }
+    return render_to_string(config.landing_template, context).encode('utf-8')
+
+
+class LandingPage:
+    """
+    Landing page `body` (bytes), with its compressed variants and their ETags
+    """
+
+    def __init__(self, body):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Content coding: (content, ETag)
+        self.variants = {IDENTITY: (body, f'"{digest}"')}
+        compressed = {GZIP: gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed[BROTLI] = brotli.compress(body, mode=brotli.MODE_TEXT)
+        for coding, content in compressed.items():
+            if len(content) < len(body):
+                self.variants[coding] = (content, f'"{digest}-{coding}"')
+
+    @classmethod
+    def render(cls, config):
+        """
+        Return the landing page of `config`, or None if its template can't be rendered
+        """
+        try:
+            return cls(render_body(config))
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Unable to render the splash landing page, redirecting instead')
+            return None
+
+    def select(self, accept_encoding):
+        """
+        Return the variant to serve for the `Accept-Encoding` header value `accept_encoding`
+        """
+        if accept_encoding:
+            accepted = accepted_encodings(accept_encoding)
+            for coding in (BROTLI, GZIP):
+                if coding in self.variants and coding in accepted:
+                    return coding
+        return IDENTITY
+
+    @staticmethod
+    def is_not_modified(if_none_match, etag):
+        """
+        Determine if the `If-None-Match` header value `if_none_match` matches `etag`, by weak comparison
+        """
+        if not if_none_match:
+            return False
+        tags = parse_etags(if_none_match)
+        return tags == ['*'] or any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in tags)
+
+    def response(self, request):
+        """
+        Return the response serving the page for `request`: a 304 if it already has the variant it accepts
+        """
+        coding = self.select(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        content, etag = self.variants[coding]
+        if self.is_not_modified(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='text/html; charset=utf-8')
+            response['Content-Length'] = str(len(content))
+            if coding != IDENTITY:
+                response['Content-Encoding'] = coding
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
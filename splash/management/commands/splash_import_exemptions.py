@@ -0,0 +1,147 @@
+"""
+Import exemption lists into a new splash configuration revision
+"""
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from splash.exemptions import NormalizedExemptions
+from splash.models import EXEMPTION_KINDS, SiteSplashConfig, SplashConfig, split_values
+
+FORMATS = ('csv', 'json', 'yaml')
+
+
+def read_csv(input_file):
+    """
+    Yield the (field, value) pairs of CSV rows, skipping an optional `field,value` header
+    """
+    for row in csv.reader(input_file):
+        if not row or row == ['field', 'value']:
+            continue
+        if len(row) != 2:
+            yield None, ','.join(row)
+            continue
+        yield row[0].strip(), row[1]
+
+
+def read_mapping(data):
+    """
+    Yield the (field, value) pairs of a mapping of field names to lists of values
+    """
+    if not isinstance(data, dict):
+        raise CommandError('The file must contain a mapping of field names to lists of values')
+    for field, values in data.items():
+        if not isinstance(values, list):
+            raise CommandError(f'The values of {field} must be a list')
+        for value in values:
+            yield field, str(value)
+
+
+def read_yaml(input_file):
+    """
+    Yield the (field, value) pairs of a YAML file
+    """
+    try:
+        import yaml  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise CommandError('Reading YAML files requires PyYAML to be installed') from error
+    return read_mapping(yaml.safe_load(input_file))
+
+
+READERS = {
+    'csv': read_csv,
+    'json': lambda input_file: read_mapping(json.load(input_file)),
+    'yaml': read_yaml,
+}
+
+
+class Command(BaseCommand):
+    """
+    Validate and normalize exemption lists from a file, and save them in a single new configuration revision.
+
+    The file holds values for the fields unaffected_usernames, unaffected_groups,
+    unaffected_url_paths and cookie_allowed_values:
+
+    * CSV: one `field,value` row per value
+    * JSON or YAML: a mapping of field names to lists of values
+
+    Values are stripped and deduplicated, and invalid ones (containing commas,
+    paths not starting with / or *, ...) are rejected. The lists in the file
+    replace the ones of the current configuration, or are added to them with
+    --append; other fields are kept.
+
+    Example:
+
+        ./manage.py splash_import_exemptions beta_users.csv --append
+    """
+    help = 'Validate exemption lists from a CSV, JSON or YAML file, and save them in a new configuration revision'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=FORMATS, help='Format of the file (default: from its extension)')
+        parser.add_argument('--append', action='store_true', help='Add the values to the current ones')
+        parser.add_argument('--host', help='Import into the site configuration of this host')
+        parser.add_argument('--username', help='User recorded as having made the change')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without saving')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format == 'yml':
+            file_format = 'yaml'
+        if file_format not in FORMATS:
+            raise CommandError(f"Unknown format, use --format with one of: {', '.join(FORMATS)}")
+
+        if options['host']:
+            config = SiteSplashConfig.current(options['host'].strip().lower())
+        else:
+            config = SplashConfig.current()
+
+        started = time.perf_counter()
+        exemptions = {}
+        unknown_fields = 0
+        with open(options['path'], newline='', encoding='utf-8') as input_file:
+            for field, value in READERS[file_format](input_file):
+                if field not in EXEMPTION_KINDS:
+                    unknown_fields += 1
+                    if options['verbosity'] >= 2:
+                        self.stderr.write(f'Rejected {value!r}: unknown field {field!r}')
+                    continue
+                if field not in exemptions:
+                    current_values = split_values(getattr(config, field)) if options['append'] else ()
+                    exemptions[field] = NormalizedExemptions(field, current_values)
+                exemptions[field].add(value)
+        validated = time.perf_counter()
+
+        for field, normalized in exemptions.items():
+            setattr(config, field, normalized.as_field_value())
+            self.stdout.write(
+                f'{field}: {len(normalized.values)} values, '
+                f'{len(normalized.rejected)} rejected, {normalized.duplicates} duplicates'
+            )
+            if options['verbosity'] >= 2:
+                for value, error in normalized.rejected:
+                    self.stderr.write(f'Rejected {value!r} for {field}: {error}')
+        if unknown_fields:
+            self.stdout.write(f'{unknown_fields} values rejected for unknown fields or malformed rows')
+        self.stdout.write(f'Read and validated in {validated - started:.3f}s')
+
+        if options['dry_run'] or not exemptions:
+            self.stdout.write('Nothing saved')
+            return
+
+        config.changed_by = None
+        if options['username']:
+            try:
+                config.changed_by = get_user_model().objects.get(username=options['username'])
+            except get_user_model().DoesNotExist as error:
+                raise CommandError(f"Unknown user {options['username']}") from error
+        try:
+            config.save()
+        except ValidationError as error:
+            raise CommandError(f'Invalid configuration: {error}') from error
+        self.stdout.write(f'Saved configuration revision {config.pk} in {time.perf_counter() - validated:.3f}s')
@@ -0,0 +1,43 @@
+"""
+Generate the proxy rules applying the current splash configuration
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from splash.models import SiteSplashConfig, SplashConfig
+from splash.proxy_rules import ProxyRulesError, build_proxy_rules, render_json, render_nginx
+from splash.snapshot import SplashSnapshot
+
+
+class Command(BaseCommand):
+    """
+    Compile the current splash configuration into nginx rules, or JSON for other proxies.
+
+    nginx compares cookie names, exact paths and cookie values case-insensitively, unlike the middleware.
+
+    Example:
+
+        ./manage.py splash_proxy_rules --format nginx --host www.example.com > /etc/nginx/splash.conf
+    """
+    help = 'Compile the current splash configuration into nginx rules, or JSON for other proxies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('nginx', 'json'), default='nginx', help='Output format')
+        parser.add_argument(
+            '--host',
+            help='Use the site configuration of this host, when it has one, instead of the global configuration'
+        )
+
+    def handle(self, *args, **options):
+        config = None
+        if options['host']:
+            config = SiteSplashConfig.current(options['host'].lower())
+        if config is None or config.pk is None:
+            config = SplashConfig.current()
+
+        rules = build_proxy_rules(SplashSnapshot(config))
+        if options['format'] == 'json':
+            return render_json(rules)
+        try:
+            return render_nginx(rules)
+        except ProxyRulesError as error:
+            raise CommandError(str(error)) from error
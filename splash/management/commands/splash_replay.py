@@ -0,0 +1,118 @@
+"""
+Replay an access log against a candidate splash configuration
+"""
+import sys
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from splash.models import SiteSplashConfig, SplashConfig
+from splash.replay import DEFAULT_CHUNK_SIZE, FORMATS, Replayer, build_replay_snapshot, read_log, replay
+from splash.snapshot import REDIRECT
+
+from .splash_trace import default_host
+
+# Fields which don't change the decisions
+NON_CANDIDATE_FIELDS = ('id', 'change_date', 'changed_by', 'host')
+
+
+class Command(BaseCommand):
+    """
+    Run the requests of an access log through the decisions of the splash middleware for a candidate
+    configuration, and report how many would be redirected, the rules exempting the others, and the
+    throughput.
+
+    The candidate is the current configuration (or --revision, or the site configuration of --host),
+    with the fields given with --set changed. It isn't saved.
+
+    The log holds one request per line: tab-separated path, splash cookie value, username and IP
+    address (`-` for a missing value), or JSON objects with the keys path, cookie, username and
+    remote_addr with --format jsonl.
+
+    Example:
+
+        ./manage.py splash_replay access.tsv --set unaffected_url_paths=/api/*,/heartbeat --processes 4
+    """
+    help = 'Replay an access log against a candidate splash configuration, and report its redirect rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Log file to replay, - for the standard input')
+        parser.add_argument('--format', choices=FORMATS, default='tsv', help='Format of the log')
+        parser.add_argument('--revision', type=int, help='Start from this configuration revision')
+        parser.add_argument('--host', help='Start from the site configuration of this host, and replay requests to it')
+        parser.add_argument(
+            '--set', action='append', default=[], metavar='FIELD=VALUE', help='Change a field of the candidate'
+        )
+        parser.add_argument('--processes', type=int, default=1, help='Number of processes to replay with')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Lines per chunk')
+        parser.add_argument('--top', type=int, default=10, help='Number of rules to list')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--processes and --chunk-size must be positive')
+        config = self.get_candidate(options)
+        replayer = Replayer(build_replay_snapshot(config), options['host'] or default_host())
+
+        if options['path'] == '-':
+            result, elapsed = self.replay(replayer, sys.stdin, options)
+        else:
+            with open(options['path'], encoding='utf-8', errors='replace') as log_file:
+                result, elapsed = self.replay(replayer, log_file, options)
+
+        self.stdout.write(f'Requests: {result.requests} ({result.malformed} malformed lines skipped)')
+        self.stdout.write(f'Redirected: {result.outcomes[REDIRECT]} ({result.redirect_rate:.2%})')
+        self.stdout.write('Outcomes:')
+        for outcome, count in result.outcomes.most_common():
+            self.stdout.write(f'  {outcome:<14}{count:>10}  {count / result.requests:>7.2%}')
+        self.stdout.write('Top rules:')
+        for rule, count in result.rules.most_common(options['top']):
+            self.stdout.write(f'  {count:>10}  {rule}')
+        rate = result.requests / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"Replayed in {elapsed:.3f}s with {options['processes']} process(es): {rate:,.0f} requests/s"
+        )
+
+    def replay(self, replayer, lines, options):
+        """
+        Replay the log `lines`
+        """
+        entries = read_log(lines, options['format'])
+        return replay(replayer, entries, options['processes'], options['chunk_size'])
+
+    def get_candidate(self, options):
+        """
+        Return the candidate configuration: the base one, unsaved with the changes of --set if there are any
+        """
+        if options['revision'] is not None:
+            model = SiteSplashConfig if options['host'] else SplashConfig
+            try:
+                config = model.objects.get(pk=options['revision'])
+            except model.DoesNotExist as error:
+                raise CommandError(f"Unknown configuration revision {options['revision']}") from error
+        elif options['host']:
+            config = SiteSplashConfig.current(options['host'].strip().lower())
+            if config.pk is None:
+                config = SplashConfig.current()
+        else:
+            config = SplashConfig.current()
+        if not options['set']:
+            return config
+
+        config.pk = None
+        for assignment in options['set']:
+            name, separator, value = assignment.partition('=')
+            try:
+                field = config._meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+            if not separator or field is None or name in NON_CANDIDATE_FIELDS or not field.editable:
+                raise CommandError(f'Invalid --set {assignment!r}: use FIELD=VALUE with a configuration field')
+            try:
+                setattr(config, field.attname, field.to_python(value))
+            except ValidationError as error:
+                raise CommandError(f'Invalid value for {name}: {" ".join(error.messages)}') from error
+        try:
+            config.full_clean(exclude=['changed_by'], validate_unique=False)
+        except ValidationError as error:
+            raise CommandError(f'Invalid configuration: {error}') from error
+        return config
@@ -0,0 +1,104 @@
+"""
+Trace synthetic requests through the splash middleware
+"""
+import json
+import statistics
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client import RequestFactory
+from django.utils.functional import SimpleLazyObject
+
+from splash.middleware import SplashMiddleware
+from splash.snapshot import get_snapshot
+from splash.tracing import PHASES, Tracer
+
+
+def default_host():
+    """
+    Return a host name accepted by `ALLOWED_HOSTS`
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if '*' not in host:
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    """
+    Run synthetic requests through `SplashMiddleware` with every request traced, and dump the traces,
+    or a summary of the time spent in each phase and of the outcomes.
+
+    Example:
+
+        ./manage.py splash_trace / /dashboard --requests 1000 --cookie seen
+    """
+    help = 'Trace synthetic requests through the splash middleware, and dump the traces or their summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/'], help='Paths of the requests')
+        parser.add_argument('--requests', type=int, default=100, help='Number of requests per path')
+        parser.add_argument('--host', help='Host of the requests (default: the first one of ALLOWED_HOSTS)')
+        parser.add_argument('--cookie', help='Value of the splash cookie')
+        parser.add_argument('--username', help='Username of the user of the requests (default: anonymous)')
+        parser.add_argument('--json', action='store_true', help='Dump the traces as JSON instead of the summary')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        User = get_user_model()
+        user_id = None
+        if options['username']:
+            try:
+                user_id = User.objects.get(username=options['username']).pk
+            except User.DoesNotExist as error:
+                raise CommandError(f'Unknown user {options["username"]}') from error
+
+        middleware = SplashMiddleware(lambda request: None)
+        # Synthetic requests aren't reported to the instrumentation hook
+        middleware.instrument = None
+        middleware.tracer = Tracer(1, options['requests'] * len(options['paths']))
+        request_factory = RequestFactory(SERVER_NAME=options['host'] or default_host())
+        if options['cookie'] is not None:
+            request_factory.cookies[get_snapshot(request_factory.get('/')).cookie_name] = options['cookie']
+        for path in options['paths']:
+            for _ in range(options['requests']):
+                request = request_factory.get(path)
+                # Loaded lazily, as by `AuthenticationMiddleware`
+                request.user = (
+                    AnonymousUser() if user_id is None else SimpleLazyObject(partial(User.objects.get, pk=user_id))
+                )
+                middleware.process_request(request)
+
+        traces = middleware.tracer.dump()
+        if options['json']:
+            return json.dumps(traces, indent=2)
+        return self.summarize(traces)
+
+    def summarize(self, traces):
+        """
+        Return the count of each outcome, and the mean and 95th percentile of the time spent in each phase
+        """
+        lines = ['Outcomes:']
+        outcomes = {}
+        for trace in traces:
+            outcomes[trace['outcome']] = outcomes.get(trace['outcome'], 0) + 1
+        for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]):
+            lines.append(f'  {outcome:<14}{count:>8}')
+
+        lines.append(f'Phases (microseconds):  {"count":>8}{"mean":>10}{"p95":>10}')
+        for phase in (*PHASES, 'total'):
+            if phase == 'total':
+                timings = [trace['total'] for trace in traces]
+            else:
+                timings = [trace['phases'][phase] for trace in traces if phase in trace['phases']]
+            if not timings:
+                continue
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            lines.append(
+                f'  {phase:<22}{len(timings):>8}{statistics.fmean(timings) * 1e6:>10.1f}{p95 * 1e6:>10.1f}'
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,133 @@
+"""
+Splash screen - URL path matching
+"""
+import re
+
+
+def wildcard_to_regex(pattern):
+    """
+    Translate a wildcard `pattern` into the equivalent regular expression source.
+
+    Each wildcard (*) represents a sequence of zero or more arbitrary characters.
+    """
+    return re.escape(pattern).replace('\\*', '.*')
+
+
+def literal_segments(pattern):
+    """
+    Return the complete path segments a path must start with to match the wildcard `pattern`
+
+    These are the segments of the literal part of the pattern (before its first
+    wildcard) which are followed by a slash: `/api/v1/*` gives `['', 'api', 'v1']`.
+    """
+    prefix = pattern[:pattern.index('*')]
+    if '/' not in prefix:
+        return []
+    return prefix[:prefix.rindex('/')].split('/')
+
+
+class PrefixTrieNode:
+    """
+    Node of the prefix trie of `PathMatcher`, holding the wildcard patterns
+    whose literal segments lead to it
+    """
+    __slots__ = ('children', 'patterns', 'regex')
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = []
+        self.regex = None
+
+    def matches(self, path):
+        """
+        Determine whether `path` matches one of the patterns of this node.
+
+        The patterns are merged into a single alternation, compiled on first use.
+        """
+        if self.regex is None:
+            self.compile()
+        return self.regex.match(path) is not None
+
+    def compile(self):
+        """
+        Compile the alternation of the patterns of this node
+        """
+        self.regex = re.compile('(?:{})$'.format('|'.join(wildcard_to_regex(pattern) for pattern in self.patterns)))
+
+
+class PathMatcher:
+    """
+    Compiled form of a list of unaffected URL path patterns
+
+    Exact paths are looked up in a set. Wildcard patterns are indexed in a trie
+    by the path segments of their literal prefix, so that checking a path only
+    tries the patterns which share its leading segments: one regex match per
+    segment of the path at most, whatever the number of patterns.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.exact_paths = frozenset(self.patterns)
+        self.root = PrefixTrieNode()
+        for pattern in self.patterns:
+            if '*' in pattern:
+                node = self.root
+                for segment in literal_segments(pattern):
+                    node = node.children.setdefault(segment, PrefixTrieNode())
+                node.patterns.append(pattern)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def compile(self):
+        """
+        Compile the regexes of all the nodes ahead of their first use
+        """
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node.patterns and node.regex is None:
+                node.compile()
+            nodes.extend(node.children.values())
+
+    def matches(self, path):
+        """
+        Determine whether `path` matches any of the patterns.
+        """
+        if path in self.exact_paths:
+            return True
+
+        node = self.root
+        if node.patterns and node.matches(path):
+            return True
+        # Only segments followed by a slash can lead to a pattern
+        for segment in path.split('/')[:-1]:
+            node = node.children.get(segment)
+            if node is None:
+                return False
+            if node.patterns and node.matches(path):
+                return True
+        return False
+
+    def matching_pattern(self, path):
+        """
+        Return the pattern matching `path`, None if none does.
+
+        Tries the patterns of the matching node one by one: meant for reports rather than for requests.
+        """
+        if path in self.exact_paths:
+            return path
+
+        nodes = [self.root]
+        node = self.root
+        for segment in path.split('/')[:-1]:
+            node = node.children.get(segment)
+            if node is None:
+                break
+            nodes.append(node)
+        for node in nodes:
+            if node.patterns and node.matches(path):
+                for pattern in node.patterns:
+                    if re.match(wildcard_to_regex(pattern) + '$', path):
+                        return pattern
+        return None
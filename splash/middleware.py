@@ -2,16 +2,46 @@
 Splash screen - Middleware
 """
 import logging
+import math
 import re
+import time
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 
-from .models import SplashConfig
+from . import tracing
+from .instrumentation import CONFIG_FETCH, DECISION, get_instrumentation_hook
+from .matcher import wildcard_to_regex
+from .snapshot import (COOKIE_OK, DISABLED, EXEMPT_PATH, EXEMPT_USER, REDIRECT, REDIRECT_URL, SAMPLED_OUT,
+                       afetch_snapshot, aget_snapshot, fetch_snapshot, get_snapshot, warm_up)
+from .tracing import get_tracer
 
 log = logging.getLogger(__name__)
 
 
+async def aget_user(request):
+    """
+    Return the user of an async request
+
+    Django 5.0+ loads the user natively with `request.auser()`, older versions
+    need a thread to access the session and the database.
+    """
+    auser = getattr(request, 'auser', None)
+    if auser is not None:
+        return await auser()
+
+    def get_user():
+        user = request.user
+        # Evaluate the lazy user in the thread
+        user.pk  # pylint: disable=pointless-statement
+        return user
+    return await sync_to_async(get_user)()
+
+
 class SplashMiddleware(MiddlewareMixin):
     """
     Checks incoming requests, to redirect users to a configured splash screen URL
@@ -19,32 +49,260 @@ class SplashMiddleware(MiddlewareMixin):
 
     This can be used to display a small marketing landing page, protect an
     alpha website from the public eye, make an announcement, etc.
+
+    Redirects vary on cookies. To let a CDN or a caching proxy serve them,
+    `SPLASH_REDIRECT_CACHE_CONTROL` sets their `Cache-Control` directives (as
+    keyword arguments of `patch_cache_control`), and `SPLASH_EXEMPTION_HINT_HEADER`
+    names a header listing the cookies which may exempt a request: requests
+    carrying none of them get the same redirect.
+
+    Configurations with `landing_page` enabled get their landing page served
+    from memory instead of the redirect, with the same headers.
     """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.instrument = get_instrumentation_hook()
+        self.tracer = get_tracer()
+        self.redirect_cache_control = getattr(settings, 'SPLASH_REDIRECT_CACHE_CONTROL', None)
+        self.exemption_hint_header = getattr(settings, 'SPLASH_EXEMPTION_HINT_HEADER', None)
+        # The middleware is created when a worker loads the application, before it serves requests
+        if getattr(settings, 'SPLASH_WARM_UP', False):
+            warm_up()
+
+    async def __acall__(self, request):
+        """
+        Async version of `__call__`, checking the request without hopping to a thread
+        """
+        response = await self.aprocess_request(request)
+        return response or await self.get_response(request)
 
     def process_request(self, request):
         """
         Determine if the user needs to be redirected
         """
-        config = SplashConfig.current()
-        if not config.enabled:
-            return None
+        if self.tracer is not None:
+            trace = self.tracer.start(request)
+            if trace is not None:
+                return self.process_request_traced(request, trace)
+        if self.instrument is not None:
+            return self.process_request_instrumented(request)
 
-        # Some URLs should never be redirected
-        path_info = request.path_info
-        for unaffected_path in config.unaffected_url_paths_list:
-            if self.path_matches(path_info, unaffected_path):
-                return None
+        snapshot = get_snapshot(request)
+        return self.respond(snapshot, self.decide(snapshot, request), request)
 
-        # Some users should never be redirected
-        if request.user.username in config.unaffected_usernames_list:
-            return None
+    def process_request_instrumented(self, request):
+        """
+        `process_request`, reporting timings and outcomes to the instrumentation hook
+        """
+        started = time.perf_counter()
+        snapshot, source = fetch_snapshot(request)
+        fetched = time.perf_counter()
+        self.instrument(CONFIG_FETCH, fetched - started, {'source': source})
+        outcome = self.decide(snapshot, request)
+        self.instrument(DECISION, time.perf_counter() - fetched, {'outcome': outcome})
+        return self.respond(snapshot, outcome, request)
+
+    async def aprocess_request(self, request):
+        """
+        Async version of `process_request`
+        """
+        if self.tracer is not None:
+            trace = self.tracer.start(request)
+            if trace is not None:
+                return await self.aprocess_request_traced(request, trace)
+        if self.instrument is not None:
+            return await self.aprocess_request_instrumented(request)
+
+        snapshot = await aget_snapshot(request)
+        return self.respond(snapshot, await self.adecide(snapshot, request), request)
+
+    async def aprocess_request_instrumented(self, request):
+        """
+        Async version of `process_request_instrumented`
+        """
+        started = time.perf_counter()
+        snapshot, source = await afetch_snapshot(request)
+        fetched = time.perf_counter()
+        self.instrument(CONFIG_FETCH, fetched - started, {'source': source})
+        outcome = await self.adecide(snapshot, request)
+        self.instrument(DECISION, time.perf_counter() - fetched, {'outcome': outcome})
+        return self.respond(snapshot, outcome, request)
+
+    def process_request_traced(self, request, trace):
+        """
+        `process_request`, recording the time of each phase in `trace`
+        """
+        snapshot, source = fetch_snapshot(request)
+        trace.mark(tracing.CONFIG_FETCH)
+        outcome = self.decide_without_user_traced(snapshot, request, trace)
+        if outcome is None:
+            outcome = EXEMPT_USER if snapshot.checks_users and snapshot.is_exempt_user(request.user) else REDIRECT
+            trace.mark(tracing.USER)
+        return self.respond_traced(snapshot, source, outcome, request, trace)
+
+    async def aprocess_request_traced(self, request, trace):
+        """
+        Async version of `process_request_traced`
+        """
+        snapshot, source = await afetch_snapshot(request)
+        trace.mark(tracing.CONFIG_FETCH)
+        outcome = self.decide_without_user_traced(snapshot, request, trace)
+        if outcome is None:
+            exempt = snapshot.checks_users and await snapshot.ais_exempt_user(await aget_user(request))
+            outcome = EXEMPT_USER if exempt else REDIRECT
+            trace.mark(tracing.USER)
+        return self.respond_traced(snapshot, source, outcome, request, trace)
+
+    def decide_without_user_traced(self, snapshot, request, trace):
+        """
+        `decide_without_user`, recording the time of each phase in `trace`
+
+        The decision cache is bypassed, to time the path and cookie checks apart.
+        """
+        active = snapshot.is_active()
+        trace.mark(tracing.ACTIVATION)
+        if not active:
+            return DISABLED
+
+        exempt_path = snapshot.path_matcher.matches(request.path_info)
+        trace.mark(tracing.PATH_MATCH)
+        if exempt_path:
+            return EXEMPT_PATH
+
+        cookie_value = request.COOKIES.get(snapshot.cookie_name)
+        cookie_ok = cookie_value in snapshot.cookie_allowed_values or (
+            snapshot.token_verifier is not None and snapshot.token_verifier.verify(cookie_value)
+        )
+        trace.mark(tracing.COOKIE_CHECK)
+        if cookie_ok:
+            return COOKIE_OK
 
-        cookie_value = request.COOKIES.get(config.cookie_name)
-        if (cookie_value not in config.cookie_allowed_values_list and
-                request.build_absolute_uri() != config.redirect_url):
-            return redirect(config.redirect_url)
+        redirect_url = (request.get_full_path() == snapshot.redirect_full_path and
+                        request.build_absolute_uri() == snapshot.redirect_url)
+        trace.mark(tracing.REDIRECT_URL_CHECK)
+        if redirect_url:
+            return REDIRECT_URL
+
+        if snapshot.rollout_threshold is not None:
+            sampled_out = snapshot.is_sampled_out(self.rollout_key(snapshot, request))
+            trace.mark(tracing.ROLLOUT)
+            if sampled_out:
+                return SAMPLED_OUT
         return None
 
+    def respond_traced(self, snapshot, source, outcome, request, trace):
+        """
+        `respond`, recording the trace, and reporting it to the instrumentation hook if there's one
+        """
+        response = self.respond(snapshot, outcome, request)
+        if outcome == REDIRECT:
+            trace.mark(tracing.RESPONSE)
+        trace.revision, trace.source, trace.outcome = snapshot.revision, source, outcome
+        self.tracer.record(trace)
+        if self.instrument is not None:
+            phases = trace.phases
+            self.instrument(CONFIG_FETCH, phases[tracing.CONFIG_FETCH], {'source': source})
+            decision = sum(phases.values()) - phases[tracing.CONFIG_FETCH] - phases.get(tracing.RESPONSE, 0.0)
+            self.instrument(DECISION, decision, {'outcome': outcome})
+        return response
+
+    def decide(self, snapshot, request):
+        """
+        Return the outcome for the request: why it goes through, or `REDIRECT`
+        """
+        outcome = self.decide_without_user(snapshot, request)
+        if outcome is not None:
+            return outcome
+
+        # Some users should never be redirected. This is checked last, as
+        # accessing `request.user` loads the session and the user.
+        if snapshot.checks_users and snapshot.is_exempt_user(request.user):
+            return EXEMPT_USER
+        return REDIRECT
+
+    async def adecide(self, snapshot, request):
+        """
+        Async version of `decide`
+        """
+        outcome = self.decide_without_user(snapshot, request)
+        if outcome is not None:
+            return outcome
+
+        if snapshot.checks_users and await snapshot.ais_exempt_user(await aget_user(request)):
+            return EXEMPT_USER
+        return REDIRECT
+
+    def decide_without_user(self, snapshot, request):
+        """
+        Return why the request goes through whoever the user is, None if it depends on the user
+        """
+        if not snapshot.is_active():
+            return DISABLED
+
+        exemption = snapshot.cached_exemption(request.path_info, request.COOKIES.get(snapshot.cookie_name))
+        if exemption is not None:
+            return exemption
+
+        # Don't redirect to the current URL. The host is only looked at when the path is the same.
+        if (request.get_full_path() == snapshot.redirect_full_path and
+                request.build_absolute_uri() == snapshot.redirect_url):
+            return REDIRECT_URL
+
+        if snapshot.rollout_threshold is not None and snapshot.is_sampled_out(self.rollout_key(snapshot, request)):
+            return SAMPLED_OUT
+        return None
+
+    def rollout_key(self, snapshot, request):
+        """
+        Return the string identifying the visitor of the request for rollouts
+        """
+        cookies = request.COOKIES
+        return (
+            cookies.get(settings.SESSION_COOKIE_NAME) or cookies.get(snapshot.cookie_name) or
+            request.META.get('REMOTE_ADDR', '')
+        )
+
+    def respond(self, snapshot, outcome, request):
+        """
+        Return the response for the `outcome` of `request`: None to let the request through
+        """
+        if outcome != REDIRECT:
+            return None
+
+        if snapshot.landing_page is not None:
+            response = snapshot.landing_page.response(request)
+        else:
+            response = redirect(snapshot.redirect_url)
+        # The redirect depends on the cookies, including the session one when users can be exempted
+        patch_vary_headers(response, ('Cookie',))
+        if snapshot.rollout_threshold is not None:
+            # Whether a visitor is part of the rollout doesn't show in the cookies
+            patch_cache_control(response, private=True, no_store=True)
+            return response
+        if self.redirect_cache_control:
+            patch_cache_control(response, **self.cache_control(snapshot))
+        if self.exemption_hint_header:
+            response[self.exemption_hint_header] = snapshot.exemption_hint
+        return response
+
+    def cache_control(self, snapshot):
+        """
+        Return the `SPLASH_REDIRECT_CACHE_CONTROL` directives for a redirect of `snapshot`, with
+        their lifetimes capped so that caches don't keep it past the next activation transition
+        """
+        cache_control = self.redirect_cache_control
+        remaining = snapshot.timeline.next_transition - time.time()
+        if remaining == math.inf:
+            return cache_control
+        cache_control = dict(cache_control)
+        for directive in ('max_age', 's_maxage'):
+            if directive in cache_control:
+                cache_control[directive] = max(0, min(int(cache_control[directive]), int(remaining)))
+        return cache_control
+
     def path_matches(self, path, pattern):
         """
         Determine whether `path` matches the `pattern`.
@@ -57,8 +315,7 @@ class SplashMiddleware(MiddlewareMixin):
         if path == pattern:
             matches = True
         elif '*' in pattern:
-            pattern = re.escape(pattern).replace('\\*', '.*')
-            if re.match(pattern + '$', path):
+            if re.match(wildcard_to_regex(pattern) + '$', path):
                 matches = True
 
         return matches
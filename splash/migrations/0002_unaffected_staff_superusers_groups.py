@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='splashconfig',
+            name='unaffected_groups',
+            field=models.TextField(blank=True, default='', help_text='Comma-separated list of groups whose members should never be redirected (group names)'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='unaffected_staff',
+            field=models.BooleanField(default=False, help_text='Whether staff users should never be redirected'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='unaffected_superusers',
+            field=models.BooleanField(default=False, help_text='Whether superusers should never be redirected'),
+        ),
+    ]
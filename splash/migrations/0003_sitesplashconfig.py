@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('splash', '0002_unaffected_staff_superusers_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteSplashConfig',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change_date', models.DateTimeField(auto_now_add=True, verbose_name='Change date')),
+                ('enabled', models.BooleanField(default=False, verbose_name='Enabled')),
+                ('cookie_name', models.TextField(default='edx_splash_screen', help_text='The name of the cookie to check when assessing if the user needs to be redirected')),
+                ('cookie_allowed_values', models.TextField(default='seen', help_text='Comma-separated list of values accepted as cookie values to prevent the redirect')),
+                ('unaffected_usernames', models.TextField(blank=True, default='', help_text='Comma-separated list of users which should never be redirected (usernames)')),
+                ('unaffected_staff', models.BooleanField(default=False, help_text='Whether staff users should never be redirected')),
+                ('unaffected_superusers', models.BooleanField(default=False, help_text='Whether superusers should never be redirected')),
+                ('unaffected_groups', models.TextField(blank=True, default='', help_text='Comma-separated list of groups whose members should never be redirected (group names)')),
+                ('unaffected_url_paths', models.TextField(blank=True, default='', help_text='Comma-separated list of URL paths (not including the hostname) which should not be redirected. Paths may include wildcards denoted by * (example: /*/student_view)')),
+                ('redirect_url', models.URLField(default='http://edx.org', help_text="The URL the users should be redirected to when they don't have the right cookie")),
+                ('host', models.CharField(db_index=True, help_text='The host name (without port) of the site this configuration applies to (example: www.example.com)', max_length=255)),
+                ('changed_by', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='Changed by')),
+            ],
+            options={
+                'ordering': ('-change_date',),
+                'abstract': False,
+            },
+        ),
+    ]
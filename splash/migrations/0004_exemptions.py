@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import splash.models
+
+# Exemption kind of the values of each comma-separated field, as of this migration
+EXEMPTION_KINDS = {
+    'unaffected_usernames': 'username',
+    'unaffected_groups': 'group',
+    'unaffected_url_paths': 'url_path',
+    'cookie_allowed_values': 'cookie_value',
+}
+
+
+def copy_exemptions(apps, schema_editor):
+    """
+    Store the exemption lists of the existing revisions as rows
+
+    Revisions with values too long for the rows are left without rows, and
+    keep being read from their comma-separated fields.
+    """
+    for config_name, exemption_name in (('SplashConfig', 'SplashExemption'), ('SiteSplashConfig', 'SiteSplashExemption')):
+        config_model = apps.get_model('splash', config_name)
+        exemption_model = apps.get_model('splash', exemption_name)
+        for config in config_model.objects.iterator():
+            rows = []
+            for field, kind in EXEMPTION_KINDS.items():
+                value = getattr(config, field)
+                values = [val.strip() for val in value.split(',')] if value.strip() else []
+                rows += [exemption_model(config=config, kind=kind, value=val) for val in dict.fromkeys(values)]
+            if all(len(row.value) <= 255 for row in rows):
+                exemption_model.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0003_sitesplashconfig'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SplashExemption',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('username', 'Username'), ('group', 'Group name'), ('url_path', 'URL path'), ('cookie_value', 'Cookie value')], max_length=16)),
+                ('value', splash.models.ExemptionValueField(max_length=255)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exemptions', to='splash.splashconfig')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('config', 'kind', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SiteSplashExemption',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('username', 'Username'), ('group', 'Group name'), ('url_path', 'URL path'), ('cookie_value', 'Cookie value')], max_length=16)),
+                ('value', splash.models.ExemptionValueField(max_length=255)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exemptions', to='splash.sitesplashconfig')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('config', 'kind', 'value')},
+            },
+        ),
+        migrations.RunPython(copy_exemptions, migrations.RunPython.noop),
+    ]
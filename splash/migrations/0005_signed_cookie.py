@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0004_exemptions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='signed_cookie',
+            field=models.BooleanField(default=False, help_text='Whether to also accept signed cookie values issued by the splash accept view, on top of the allowed values'),
+        ),
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='signed_cookie_max_age',
+            field=models.PositiveIntegerField(default=2592000, help_text='Number of seconds during which a signed cookie value is valid after being issued'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='signed_cookie',
+            field=models.BooleanField(default=False, help_text='Whether to also accept signed cookie values issued by the splash accept view, on top of the allowed values'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='signed_cookie_max_age',
+            field=models.PositiveIntegerField(default=2592000, help_text='Number of seconds during which a signed cookie value is valid after being issued'),
+        ),
+    ]
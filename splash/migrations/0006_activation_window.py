@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0005_signed_cookie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='active_from',
+            field=models.DateTimeField(blank=True, help_text='When enabled, the time from which the splash screen is active (always if empty)', null=True),
+        ),
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='active_until',
+            field=models.DateTimeField(blank=True, help_text='When enabled, the time until which the splash screen is active (always if empty)', null=True),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='active_from',
+            field=models.DateTimeField(blank=True, help_text='When enabled, the time from which the splash screen is active (always if empty)', null=True),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='active_until',
+            field=models.DateTimeField(blank=True, help_text='When enabled, the time until which the splash screen is active (always if empty)', null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:07
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0006_activation_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='rollout_percentage',
+            field=models.PositiveSmallIntegerField(default=100, help_text='Percentage of the visitors to redirect, to ramp up gradually. Visitors are identified by their session cookie, their splash cookie, or their IP address', validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='rollout_percentage',
+            field=models.PositiveSmallIntegerField(default=100, help_text='Percentage of the visitors to redirect, to ramp up gradually. Visitors are identified by their session cookie, their splash cookie, or their IP address', validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+    ]
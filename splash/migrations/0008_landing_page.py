@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splash', '0007_rollout_percentage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='landing_message',
+            field=models.TextField(blank=True, default='', help_text='Message of the landing page'),
+        ),
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='landing_page',
+            field=models.BooleanField(default=False, help_text='Whether to serve the landing page template to the users instead of redirecting them'),
+        ),
+        migrations.AddField(
+            model_name='sitesplashconfig',
+            name='landing_template',
+            field=models.CharField(default='splash/landing.html', help_text='Template of the landing page, rendered once per configuration revision', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='landing_message',
+            field=models.TextField(blank=True, default='', help_text='Message of the landing page'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='landing_page',
+            field=models.BooleanField(default=False, help_text='Whether to serve the landing page template to the users instead of redirecting them'),
+        ),
+        migrations.AddField(
+            model_name='splashconfig',
+            name='landing_template',
+            field=models.CharField(default='splash/landing.html', help_text='Template of the landing page, rendered once per configuration revision', max_length=100),
+        ),
+    ]
@@ -1,15 +1,91 @@
 """
 Models for the splash screen application
 """
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
+from django.db import models, transaction
+from django.dispatch import Signal
 
 from config_models.models import ConfigurationModel
 
+from .landing import render_body
 
-class SplashConfig(ConfigurationModel):
+
+def split_values(value):
     """
-    Configuration for the splash django app
+    Split a comma-separated configuration `value` into a list of stripped values
+    """
+    if not value.strip():
+        return []
+
+    return [val.strip() for val in value.split(',')]
+
+
+EXEMPTION_MAX_LENGTH = 255
+
+# Sent with `instance` once a configuration revision is saved and `current()` no longer caches the previous one
+config_saved = Signal()
+
+
+class ExemptionValueField(models.CharField):
+    """
+    Exemption value, compared case-sensitively on every database
+
+    The default collations of MySQL ignore case, which would make `Bob` and
+    `bob` duplicates of each other, and exempt either user when the other one
+    is listed: its column gets a binary collation.
+    """
+
+    def db_type(self, connection):
+        db_type = super().db_type(connection)  # pylint: disable=no-member
+        if connection.vendor == 'mysql':
+            db_type += ' CHARACTER SET utf8mb4 COLLATE utf8mb4_bin'
+        return db_type
+
+
+class AbstractSplashExemption(models.Model):
+    """
+    Value of an exemption list of a configuration revision
+
+    The comma-separated fields of the configurations remain what admins edit;
+    their values are also stored as indexed rows when a revision is saved, so
+    that they can be loaded in one query, or looked up one by one.
+    """
+    USERNAME = 'username'
+    GROUP = 'group'
+    URL_PATH = 'url_path'
+    COOKIE_VALUE = 'cookie_value'
+    KIND_CHOICES = (
+        (USERNAME, 'Username'),
+        (GROUP, 'Group name'),
+        (URL_PATH, 'URL path'),
+        (COOKIE_VALUE, 'Cookie value'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    value = ExemptionValueField(max_length=EXEMPTION_MAX_LENGTH)
+
+    class Meta:
+        abstract = True
+        unique_together = (('config', 'kind', 'value'),)
+
+
+# Exemption kind of the values of each comma-separated field
+EXEMPTION_KINDS = {
+    'unaffected_usernames': AbstractSplashExemption.USERNAME,
+    'unaffected_groups': AbstractSplashExemption.GROUP,
+    'unaffected_url_paths': AbstractSplashExemption.URL_PATH,
+    'cookie_allowed_values': AbstractSplashExemption.COOKIE_VALUE,
+}
+
+
+class AbstractSplashConfig(ConfigurationModel):
+    """
+    Fields and helpers shared by the splash configuration models
     """
+    class Meta(ConfigurationModel.Meta):
+        abstract = True
+
     cookie_name = models.TextField(
         default='edx_splash_screen',
         help_text="The name of the cookie to check when assessing if the user needs to be redirected"
@@ -23,48 +99,181 @@ class SplashConfig(ConfigurationModel):
         blank=True,
         help_text="Comma-separated list of users which should never be redirected (usernames)"
     )
+    unaffected_staff = models.BooleanField(
+        default=False,
+        help_text="Whether staff users should never be redirected"
+    )
+    unaffected_superusers = models.BooleanField(
+        default=False,
+        help_text="Whether superusers should never be redirected"
+    )
+    unaffected_groups = models.TextField(
+        default='',
+        blank=True,
+        help_text="Comma-separated list of groups whose members should never be redirected (group names)"
+    )
     unaffected_url_paths = models.TextField(
         default='',
         blank=True,
         help_text="Comma-separated list of URL paths (not including the hostname) which should not be redirected. "
                   "Paths may include wildcards denoted by * (example: /*/student_view)"
     )
+    signed_cookie = models.BooleanField(
+        default=False,
+        help_text="Whether to also accept signed cookie values issued by the splash accept view, "
+                  "on top of the allowed values"
+    )
+    signed_cookie_max_age = models.PositiveIntegerField(
+        default=30 * 24 * 60 * 60,
+        help_text="Number of seconds during which a signed cookie value is valid after being issued"
+    )
+    active_from = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When enabled, the time from which the splash screen is active (always if empty)"
+    )
+    active_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When enabled, the time until which the splash screen is active (always if empty)"
+    )
+    rollout_percentage = models.PositiveSmallIntegerField(
+        default=100,
+        validators=[MaxValueValidator(100)],
+        help_text="Percentage of the visitors to redirect, to ramp up gradually. Visitors are identified "
+                  "by their session cookie, their splash cookie, or their IP address"
+    )
     redirect_url = models.URLField(
         default='http://edx.org',
         help_text="The URL the users should be redirected to when they don't have the right cookie"
     )
+    landing_page = models.BooleanField(
+        default=False,
+        help_text="Whether to serve the landing page template to the users instead of redirecting them"
+    )
+    landing_template = models.CharField(
+        max_length=100,
+        default='splash/landing.html',
+        help_text="Template of the landing page, rendered once per configuration revision"
+    )
+    landing_message = models.TextField(
+        default='',
+        blank=True,
+        help_text="Message of the landing page"
+    )
 
     @property
     def cookie_allowed_values_list(self):
         """
         `cookie_allowed_values` as a list of string values
         """
-        if not self.cookie_allowed_values.strip():
-            return []
-
-        return [val.strip() for val in self.cookie_allowed_values.split(',')]
+        return split_values(self.cookie_allowed_values)
 
     @property
     def unaffected_usernames_list(self):
         """
         `unaffected_usernames` as a list of username values
         """
-        if not self.unaffected_usernames.strip():
-            return []
+        return split_values(self.unaffected_usernames)
 
-        return [name.strip() for name in self.unaffected_usernames.split(',')]
+    @property
+    def unaffected_groups_list(self):
+        """
+        `unaffected_groups` as a list of group names
+        """
+        return split_values(self.unaffected_groups)
 
     @property
     def unaffected_url_paths_list(self):
         """
         `unaffected_url_paths` as a list of URL paths values
         """
-        if not self.unaffected_url_paths.strip():
-            return []
+        return split_values(self.unaffected_url_paths)
 
-        return [url.strip() for url in self.unaffected_url_paths.split(',')]
+    def clean(self):
+        """Make sure the exemption lists fit in their rows, and the activation window isn't empty"""
+        super().clean()
+        errors = {}
+        if self.active_from and self.active_until and self.active_until <= self.active_from:
+            errors['active_until'] = 'The end of the activation window must be after its start'
+        for field in EXEMPTION_KINDS:
+            too_long = [value for value in split_values(getattr(self, field)) if len(value) > EXEMPTION_MAX_LENGTH]
+            if too_long:
+                errors[field] = f'Values are limited to {EXEMPTION_MAX_LENGTH} characters: {too_long[0][:50]}...'
+        if self.landing_page:
+            # Rendered as the snapshots render it, so that errors only raised while rendering are caught too
+            try:
+                render_body(self)
+            except Exception as error:  # pylint: disable=broad-except
+                errors['landing_template'] = f'Invalid template: {error}'
+        if errors:
+            raise ValidationError(errors)
 
     def save(self, *args, **kwargs):
         """Call `full_clean` before saving to ensure proper validation of configuration values"""
         self.full_clean()
         super().save(*args, **kwargs)
+        self.save_exemptions()
+        config_saved.send(sender=type(self), instance=self)
+
+    def save_exemptions(self):
+        """
+        Store the values of the exemption lists of this revision as rows of `exemptions`
+        """
+        exemption_model = self.exemptions.model  # pylint: disable=no-member
+        # All or nothing: a revision without rows is read from its comma-separated fields
+        with transaction.atomic():
+            exemption_model.objects.bulk_create(
+                [
+                    exemption_model(config=self, kind=kind, value=value)
+                    for field, kind in EXEMPTION_KINDS.items()
+                    for value in dict.fromkeys(split_values(getattr(self, field)))
+                ],
+                batch_size=1000,
+            )
+
+
+class SplashConfig(AbstractSplashConfig):
+    """
+    Configuration for the splash django app
+    """
+
+
+class SiteSplashConfig(AbstractSplashConfig):
+    """
+    Configuration for the splash django app, for the requests made to a given host
+
+    Takes precedence over `SplashConfig` for that host.
+    """
+    KEY_FIELDS = ('host',)
+
+    host = models.CharField(
+        max_length=255,
+        db_index=True,
+        help_text="The host name (without port) of the site this configuration applies to (example: www.example.com)"
+    )
+
+    def save(self, *args, **kwargs):
+        """Normalize the host name, as hosts are compared in lower case"""
+        self.host = self.host.strip().lower()
+        super().save(*args, **kwargs)
+
+
+class SplashExemption(AbstractSplashExemption):
+    """
+    Value of an exemption list of a `SplashConfig` revision
+    """
+    config = models.ForeignKey(SplashConfig, on_delete=models.CASCADE, related_name='exemptions')
+
+    class Meta(AbstractSplashExemption.Meta):
+        pass
+
+
+class SiteSplashExemption(AbstractSplashExemption):
+    """
+    Value of an exemption list of a `SiteSplashConfig` revision
+    """
+    config = models.ForeignKey(SiteSplashConfig, on_delete=models.CASCADE, related_name='exemptions')
+
+    class Meta(AbstractSplashExemption.Meta):
+        pass
@@ -0,0 +1,201 @@
+"""
+Splash screen - Rules for proxies
+
+Compiles a splash configuration into rules a proxy in front of Django (nginx,
+or any proxy reading the JSON form) can apply itself, so that splashed
+requests never reach Django.
+
+The proxy redirects a request when the middleware would, except that it can't
+tell who the user is: when users can be exempted, requests carrying a session
+cookie are passed through, for the middleware to decide. It also can't tell a
+missing cookie from an empty one, so an allowed empty cookie value lets both
+through. Nor can it verify signed cookie values: when they're enabled,
+requests carrying any splash cookie are passed through as well. Partial
+rollouts and landing pages served by the middleware are left to it entirely.
+
+Unlike the middleware, nginx compares the strings of its `map` blocks (exact
+paths, cookie values and the redirect URL) and the names of `$cookie_*`
+variables case-insensitively: nginx rules also let through the requests whose
+path or splash cookie value only differ by case from an exempted one.
+"""
+import json
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+
+from .matcher import wildcard_to_regex
+
+NGINX_VARIABLE_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+# Source values of nginx `map` blocks read as parameters rather than strings
+NGINX_MAP_PARAMETERS = ('default', 'hostnames', 'include', 'volatile')
+
+
+class ProxyRulesError(ValueError):
+    """
+    The configuration can't be expressed as proxy rules
+    """
+
+
+def build_proxy_rules(snapshot):
+    """
+    Return the rules applied by the proxy for the configuration `snapshot`, as a JSON-serializable dict
+    """
+    patterns = snapshot.path_matcher.patterns
+    return {
+        'revision': snapshot.revision,
+        # An empty username exempts anonymous users, leaving nothing for the proxy to redirect,
+        # partial rollouts hash visitors the way the middleware does, which the proxy can't, and
+        # landing pages are served by the middleware
+        'enabled': (
+            snapshot.enabled and snapshot.rollout_threshold is None and snapshot.landing_page is None and
+            not snapshot.is_exempt_user(AnonymousUser())
+        ),
+        # Epoch timestamps of the transitions of the activation window, and whether it's active after each
+        'transitions': [list(transition) for transition in snapshot.timeline.transitions],
+        'cookie_name': snapshot.cookie_name,
+        'cookie_allowed_values': sorted(snapshot.cookie_allowed_values),
+        'signed_cookie': snapshot.token_verifier is not None,
+        # Paths always start with a slash, other exact patterns can't match
+        'exact_paths': sorted({pattern for pattern in patterns if pattern.startswith('/')}),
+        'path_regexes': [f'^{wildcard_to_regex(pattern)}$' for pattern in patterns if '*' in pattern],
+        'session_cookie_name': settings.SESSION_COOKIE_NAME if snapshot.checks_users else None,
+        'redirect_url': snapshot.redirect_url,
+    }
+
+
+def compile_path_regexes(rules):
+    """
+    Compile the path regexes of `rules`, as the proxy does
+    """
+    return [re.compile(regex) for regex in rules['path_regexes']]
+
+
+def proxy_redirects(rules, path, cookies, absolute_url, path_regexes=None, *, now=None):
+    """
+    Reference evaluation of `rules`: whether the proxy redirects a request
+
+    `cookies` maps cookie names to values, and `absolute_url` is the URL of the
+    request. `path_regexes` may be passed to reuse `compile_path_regexes(rules)`,
+    and `now` the epoch timestamp of the request.
+    """
+    if not rules['enabled']:
+        return False
+    now = time.time() if now is None else now
+    transitions = rules['transitions']
+    active = not transitions or not transitions[0][1]
+    for transition, active_after in transitions:
+        if now >= transition:
+            active = active_after
+    if not active:
+        return False
+    if path in rules['exact_paths']:
+        return False
+    if path_regexes is None:
+        path_regexes = compile_path_regexes(rules)
+    if any(regex.search(path) for regex in path_regexes):
+        return False
+    # A missing cookie reads as an empty one
+    cookie_value = cookies.get(rules['cookie_name'], '')
+    if cookie_value in rules['cookie_allowed_values'] or (rules['signed_cookie'] and cookie_value):
+        return False
+    if rules['session_cookie_name'] and cookies.get(rules['session_cookie_name']):
+        return False
+    return absolute_url != rules['redirect_url']
+
+
+def nginx_string(value):
+    """
+    Quote `value` for an nginx configuration file
+    """
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def nginx_map_key(value):
+    """
+    Quote the string `value` as the source value of an nginx `map` entry, escaping
+    the values nginx would read as a parameter or a regular expression
+    """
+    if value in NGINX_MAP_PARAMETERS or value.startswith(('~', '\\')):
+        value = '\\' + value
+    return nginx_string(value)
+
+
+def nginx_variable(cookie_name):
+    """
+    Return the nginx variable holding the value of the cookie `cookie_name`
+    """
+    if not NGINX_VARIABLE_NAME.match(cookie_name):
+        raise ProxyRulesError(f'The cookie name {cookie_name!r} is not usable as an nginx variable')
+    return f'$cookie_{cookie_name}'
+
+
+def render_nginx(rules):
+    """
+    Render `rules` as nginx `map` blocks, to include in the `http` context, and
+    the `if` block redirecting the requests, to include in a `server` or `location` block
+    """
+    if rules['transitions']:
+        raise ProxyRulesError('Activation windows can not be expressed as nginx rules')
+    lines = [
+        f"# Splash screen rules, generated from configuration revision {rules['revision']}",
+        '# Include the map blocks in the http context, and the if block in the server or location blocks.',
+        '',
+        'map $uri $splash_exempt_path {',
+        '    default 0;',
+    ]
+    lines += [f'    {nginx_map_key(path)} 1;' for path in rules['exact_paths']]
+    lines += [f"    {nginx_string('~' + regex)} 1;" for regex in rules['path_regexes']]
+    lines += [
+        '}',
+        '',
+        f"map {nginx_variable(rules['cookie_name'])} $splash_cookie_ok {{",
+    ]
+    if rules['signed_cookie']:
+        # Signed values are verified by the middleware
+        lines += ['    default 1;', f"    \"\" {int('' in rules['cookie_allowed_values'])};"]
+    else:
+        lines.append('    default 0;')
+        lines += [f'    {nginx_map_key(value)} 1;' for value in rules['cookie_allowed_values']]
+    lines += ['}', '']
+    if rules['session_cookie_name']:
+        lines += [
+            f"map {nginx_variable(rules['session_cookie_name'])} $splash_session {{",
+            '    default 1;',
+            '    "" 0;',
+            '}',
+        ]
+    else:
+        lines += [
+            'map $uri $splash_session {',
+            '    default 0;',
+            '}',
+        ]
+    lines += [
+        '',
+        'map $scheme://$http_host$request_uri $splash_redirect_url {',
+        '    default 0;',
+        f"    {nginx_map_key(rules['redirect_url'])} 1;",
+        '}',
+        '',
+        'map $splash_exempt_path$splash_cookie_ok$splash_session$splash_redirect_url $splash_redirect {',
+        '    default 0;',
+    ]
+    if rules['enabled']:
+        lines.append('    "0000" 1;')
+    lines += [
+        '}',
+        '',
+        'if ($splash_redirect) {',
+        f"    return 302 {nginx_string(rules['redirect_url'])};",
+        '}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def render_json(rules):
+    """
+    Render `rules` as JSON
+    """
+    return json.dumps(rules, indent=2, sort_keys=True) + '\n'
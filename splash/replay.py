@@ -0,0 +1,242 @@
+"""
+Splash screen - Replay of access logs
+
+Runs the requests of an access log through the decisions of
+`SplashMiddleware` for a candidate configuration, to see what it would do
+before it's saved: how many requests it redirects, which rules exempt the
+others, and how fast the requests are checked.
+
+Logs are read line by line, in one of two formats:
+
+* `tsv`: tab-separated path (with its query string), splash cookie value,
+  username and IP address; trailing fields may be left out, and `-` stands for
+  a missing value
+* `jsonl`: one JSON object per line, with the keys `path`, `cookie`,
+  `username` and `remote_addr`
+
+Lines are processed as a stream, in chunks, so that memory use doesn't depend
+on the size of the log, and can be spread over a pool of forked processes.
+
+The users of the log are never loaded: the usernames exempted by being staff,
+superusers or group members are resolved in one query before the replay.
+Visitors are picked for a rollout by their splash cookie or IP address, as
+logs don't hold session cookies.
+"""
+import json
+import multiprocessing
+import time
+from collections import Counter, deque
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.test.client import RequestFactory
+
+from .middleware import SplashMiddleware
+from .models import AbstractSplashExemption
+from .snapshot import COOKIE_OK, EXEMPT_PATH, EXEMPT_USER, REDIRECT, SplashSnapshot, load_exemption_lists
+
+FORMATS = ('tsv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def parse_tsv(line):
+    """
+    Return the (path, cookie, username, remote_addr) of a tab-separated line, None if it's malformed
+    """
+    fields = [None if value in ('', '-') else value for value in line.rstrip('\r\n').split('\t')]
+    if len(fields) > 4 or fields[0] is None:
+        return None
+    return tuple(fields + [None] * (4 - len(fields)))
+
+
+def parse_jsonl(line):
+    """
+    Return the (path, cookie, username, remote_addr) of a JSON line, None if it's malformed
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+        return None
+    return entry['path'], entry.get('cookie'), entry.get('username'), entry.get('remote_addr')
+
+
+PARSERS = {'tsv': parse_tsv, 'jsonl': parse_jsonl}
+
+
+def read_log(lines, log_format='tsv'):
+    """
+    Yield the entries of the log `lines`, None for malformed lines, skipping blank ones
+    """
+    parse = PARSERS[log_format]
+    for line in lines:
+        if line.strip():
+            yield parse(line)
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to `size` items of `iterable`
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_replay_snapshot(config):
+    """
+    Return the snapshot of `config` (saved or not) for a replay, with all its usernames in memory
+    """
+    exemption_lists, usernames_in_db = load_exemption_lists(config)
+    if usernames_in_db:
+        exemption_lists[AbstractSplashExemption.USERNAME] = list(
+            config.exemptions.filter(kind=AbstractSplashExemption.USERNAME).values_list('value', flat=True)
+        )
+    return SplashSnapshot(config, (exemption_lists, False))
+
+
+class ReplayUser:
+    """
+    User of a log entry, with just what the exemption checks look at
+    """
+    is_authenticated = True
+
+    def __init__(self, username, pk):
+        self.username = username
+        self.pk = pk
+
+
+class ReplayResult:
+    """
+    Counts of the outcomes and of the rules deciding on the replayed requests
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.malformed = 0
+        self.outcomes = Counter()
+        self.rules = Counter()
+
+    def merge(self, other):
+        """
+        Add the counts of the result `other` to this one
+        """
+        self.requests += other.requests
+        self.malformed += other.malformed
+        self.outcomes.update(other.outcomes)
+        self.rules.update(other.rules)
+        return self
+
+    @property
+    def redirect_rate(self):
+        """
+        Share of the requests which are redirected
+        """
+        return self.outcomes[REDIRECT] / self.requests if self.requests else 0.0
+
+
+class Replayer:
+    """
+    Decides on log entries with the middleware and the snapshot of a configuration, as for requests to `host`
+    """
+
+    def __init__(self, snapshot, host):
+        self.snapshot = snapshot
+        self.middleware = SplashMiddleware(lambda request: None)
+        # Replayed requests are neither traced nor reported to the instrumentation hook
+        self.middleware.instrument = self.middleware.tracer = None
+        self.request_factory = RequestFactory(SERVER_NAME=host)
+        # IDs of the users exempted by being staff, superusers or group members, by username
+        self.exempt_user_ids = {}
+        if snapshot.exempt_users is not None:
+            snapshot.exempt_users.load()
+            self.exempt_user_ids = dict(
+                get_user_model().objects.filter(pk__in=snapshot.exempt_users.user_ids).values_list('username', 'pk')
+            )
+
+    def replay(self, entries):
+        """
+        Return the `ReplayResult` of the log `entries`
+        """
+        result = ReplayResult()
+        snapshot, middleware = self.snapshot, self.middleware
+        for entry in entries:
+            if entry is None:
+                result.malformed += 1
+                continue
+            path, cookie, username, remote_addr = entry
+            request = self.request_factory.get(path, REMOTE_ADDR=remote_addr or '')
+            if cookie is not None:
+                request.COOKIES = {snapshot.cookie_name: cookie}
+            request.user = (
+                AnonymousUser() if username is None else ReplayUser(username, self.exempt_user_ids.get(username))
+            )
+            outcome = middleware.decide(snapshot, request)
+            result.requests += 1
+            result.outcomes[outcome] += 1
+            result.rules[self.rule(outcome, request, username)] += 1
+        return result
+
+    def rule(self, outcome, request, username):
+        """
+        Return the description of the rule behind the `outcome` of `request`
+        """
+        snapshot = self.snapshot
+        if outcome == EXEMPT_PATH:
+            return f'{outcome} {snapshot.path_matcher.matching_pattern(request.path_info)}'
+        if outcome == COOKIE_OK:
+            cookie = request.COOKIES.get(snapshot.cookie_name)
+            return f'{outcome} {cookie if cookie in snapshot.cookie_allowed_values else "(signed token)"}'
+        if outcome == EXEMPT_USER:
+            if username in snapshot.unaffected_usernames:
+                return f'{outcome} (unaffected username)'
+            return f'{outcome} (staff, superuser or group member)'
+        return outcome
+
+
+_replayer = None
+
+
+def replay_chunk(entries):
+    """
+    Replay a chunk of entries with the replayer of the pool
+    """
+    return _replayer.replay(entries)
+
+
+def replay(replayer, entries, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Replay the log `entries` with `replayer`, in a pool of `processes` forked processes if more than one
+
+    Returns the `ReplayResult` and the number of seconds it took. At most two
+    chunks per process are read ahead of the ones being replayed.
+    """
+    global _replayer  # pylint: disable=global-statement
+    started = time.perf_counter()
+    result = ReplayResult()
+    if processes <= 1:
+        for chunk in chunked(entries, chunk_size):
+            result.merge(replayer.replay(chunk))
+        return result, time.perf_counter() - started
+
+    # The processes inherit the replayer, but not the database connections
+    connections.close_all()
+    _replayer = replayer
+    try:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            pending = deque()
+            for chunk in chunked(entries, chunk_size):
+                pending.append(pool.apply_async(replay_chunk, (chunk,)))
+                if len(pending) >= 2 * processes:
+                    result.merge(pending.popleft().get())
+            while pending:
+                result.merge(pending.popleft().get())
+    finally:
+        _replayer = None
+    return result, time.perf_counter() - started
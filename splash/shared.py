@@ -0,0 +1,143 @@
+"""
+Splash screen - Snapshot shared between the processes of a host
+
+When `SPLASH_SHARED_SNAPSHOT_PATH` is set, the processes of a host share the
+configurations they build their snapshots from through files:
+
+* the header file, at that path, is memory-mapped by every process. It holds
+  a generation counter, bumped whenever new configuration revisions are
+  published, and the time they were last checked.
+* the payload file of each generation, next to it, holds the configurations
+  and their parsed exemption lists.
+
+Once the last check is older than `SPLASH_CONFIG_CHECK_INTERVAL`, the first
+process to take the lock (with `flock`) checks for new revisions in the cache
+and the database, and publishes them if there are any. The other processes
+only read the header, and load a payload when its generation changes.
+
+The payloads are pickled, like the configurations in the Django cache: the
+files are created readable by their owner only, and must be kept in a
+directory only the application user can write to.
+"""
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from contextlib import contextmanager
+
+# Magic, format version, generation, epoch time of the last check
+HEADER = struct.Struct('<4sIQd')
+MAGIC = b'SPLS'
+VERSION = 1
+# Offset of the time of the last check in the header
+CHECKED_AT = struct.Struct('<d')
+CHECKED_AT_OFFSET = HEADER.size - CHECKED_AT.size
+
+
+class SharedSnapshotError(ValueError):
+    """
+    A file doesn't hold a valid shared snapshot
+    """
+
+
+class SharedSnapshotFile:
+    """
+    Header and payload files of the shared snapshot at `path`
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._header = None
+
+    def header(self):
+        """
+        Return the memory-mapped header, creating it if needed
+        """
+        if self._header is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < HEADER.size:
+                    with self.locked(blocking=True):
+                        if os.fstat(fd).st_size < HEADER.size:
+                            os.ftruncate(fd, HEADER.size)
+                            os.pwrite(fd, HEADER.pack(MAGIC, VERSION, 0, 0.0), 0)
+                header = mmap.mmap(fd, HEADER.size)
+            finally:
+                os.close(fd)
+            magic, version, _, _ = HEADER.unpack_from(header)
+            if magic != MAGIC or version != VERSION:
+                raise SharedSnapshotError(f'{self.path} does not hold a shared snapshot header')
+            self._header = header
+        return self._header
+
+    def read(self):
+        """
+        Return the current generation, and the epoch time of the last check
+        """
+        _, _, generation, checked_at = HEADER.unpack_from(self.header())
+        return generation, checked_at
+
+    def payload_path(self, generation):
+        """
+        Return the path of the payload file of `generation`
+        """
+        return f'{self.path}.{generation}'
+
+    def load(self, generation):
+        """
+        Return the payload of `generation`
+        """
+        with open(self.payload_path(generation), 'rb') as payload_file:
+            return pickle.load(payload_file)
+
+    def publish(self, payload, checked_at):
+        """
+        Write `payload` as a new generation and return it. Must be called with the lock held.
+        """
+        generation = self.read()[0] + 1
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                pickle.dump(payload, output, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.payload_path(generation))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        # The payload is complete before its generation is visible
+        HEADER.pack_into(self.header(), 0, MAGIC, VERSION, generation, checked_at)
+        # Processes may still be loading the previous generation
+        try:
+            os.unlink(self.payload_path(generation - 2))
+        except FileNotFoundError:
+            pass
+        return generation
+
+    def touch(self, checked_at):
+        """
+        Record that the current generation was checked at the epoch time `checked_at`.
+        Must be called with the lock held.
+        """
+        CHECKED_AT.pack_into(self.header(), CHECKED_AT_OFFSET, checked_at)
+
+    @contextmanager
+    def locked(self, blocking=False):
+        """
+        Hold the lock of the shared snapshot, yielding whether it was acquired
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
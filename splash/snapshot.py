@@ -0,0 +1,800 @@
+"""
+Splash screen - In-process configuration snapshot
+
+`SplashConfig.current()` goes through the Django cache (and the database on a
+miss) and the model exposes its values as comma-separated strings. The
+middleware works instead from a `SplashSnapshot`: an immutable, parsed view of
+the current configuration revision kept in process memory.
+
+The snapshot is dropped as soon as a new `SplashConfig` is saved in this
+process. Other processes notice new revisions through a version check against
+`SplashConfig.current()`, done at most once every
+`SPLASH_CONFIG_CHECK_INTERVAL` seconds.
+
+When `SPLASH_DECISION_CACHE_SIZE` is set, the outcome of the checks which
+don't depend on the user (path and cookie) is memoized in a bounded LRU cache
+attached to the snapshot.
+
+Users exempted by being staff, superusers or group members are resolved to a
+set of user IDs in one query, refreshed along with the revision check at most
+every `SPLASH_EXEMPT_USERS_REFRESH_INTERVAL` seconds, so that checking a user
+is a set lookup.
+
+The exemption lists of a revision are loaded from its indexed exemption rows in
+one query. Past `SPLASH_MAX_IN_MEMORY_USERNAMES` usernames, they're left in the
+database and each user is looked up with an indexed query instead. With
+`SPLASH_USERNAME_BLOOM_FILTER`, a Bloom filter of these usernames, built once
+per revision, spares the query for most users who aren't in the list; it can be
+shared by the workers of a host through a file memory-mapped from
+`SPLASH_USERNAME_BLOOM_FILTER_DIR`.
+
+Activation windows are evaluated in memory against a timeline precomputed per
+revision, so that the splash screen switches on and off at the configured
+times without any configuration read.
+
+A revision can be rolled out to a percentage of the visitors, picked by a
+CRC32 hash of their session cookie, splash cookie or IP address.
+
+With `SPLASH_SHARED_SNAPSHOT_PATH`, the processes of a host share the
+configurations through files (see `splash.shared`): a single process checks
+for new revisions, and the others reload only when it publishes some.
+
+With `SPLASH_INVALIDATION_BACKEND` (see `splash.invalidation`), saving a
+revision notifies every subscribed process, which then keeps its snapshots
+until it's notified rather than checking for new revisions.
+
+Configurations with `landing_page` enabled get their landing page rendered and
+compressed along with their snapshot (see `splash.landing`).
+
+`warm_up()` loads all of this ahead of the first request; `SplashMiddleware`
+calls it when it's created if `SPLASH_WARM_UP` is set.
+
+Hosts with a `SiteSplashConfig` get their own snapshot. All the site
+configurations are loaded in one query (cached like `SplashConfig.current()`),
+and the snapshot of a request is picked from a dict keyed by host.
+"""
+import hashlib
+import logging
+import math
+import os
+import pickle
+import re
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from edx_django_utils.cache import TieredCache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http.request import split_domain_port
+from django.utils import timezone
+
+from .bloom import KEY_SIZE, BloomFilter, BloomFilterError
+from .invalidation import get_invalidation_backend
+from .landing import LandingPage
+from .lru import LRUCache
+from .matcher import PathMatcher
+from .models import EXEMPTION_KINDS, AbstractSplashExemption, SiteSplashConfig, SplashConfig, config_saved, split_values
+from .shared import SharedSnapshotError, SharedSnapshotFile
+from .tokens import TokenVerifier
+
+DEFAULT_CHECK_INTERVAL = 5
+DEFAULT_EXEMPT_USERS_REFRESH_INTERVAL = 60
+
+# Why a request goes through, or gets redirected
+DISABLED = 'disabled'
+EXEMPT_PATH = 'exempt-path'
+EXEMPT_USER = 'exempt-user'
+COOKIE_OK = 'cookie-ok'
+REDIRECT_URL = 'redirect-url'
+SAMPLED_OUT = 'sampled-out'
+REDIRECT = 'redirect'
+
+# Where the configuration is read from
+SOURCE_SNAPSHOT = 'snapshot'
+SOURCE_CACHE = 'cache'
+SOURCE_DB = 'db'
+SOURCE_SHARED = 'shared'
+
+SITE_CONFIGS_CACHE_KEY = 'configuration/SiteSplashConfig/current_set'
+
+_MISSING = object()
+
+log = logging.getLogger(__name__)
+
+
+class ExemptUsers:
+    """
+    IDs of the users exempted by being staff, superusers or members of some groups
+
+    They are loaded in one query, and reloaded by `SnapshotStore` once they're
+    older than `SPLASH_EXEMPT_USERS_REFRESH_INTERVAL` seconds, as memberships
+    change without a new configuration revision.
+    """
+
+    def __init__(self, staff, superusers, group_names):
+        self.staff = staff
+        self.superusers = superusers
+        self.group_names = tuple(group_names)
+        self.user_ids = frozenset()
+        self.loaded_at = None
+
+    def is_stale(self, now):
+        """
+        Determine if the user IDs should be reloaded
+        """
+        refresh_interval = getattr(
+            settings, 'SPLASH_EXEMPT_USERS_REFRESH_INTERVAL', DEFAULT_EXEMPT_USERS_REFRESH_INTERVAL
+        )
+        return self.loaded_at is None or now - self.loaded_at >= refresh_interval
+
+    def load(self):
+        """
+        Load the IDs of the exempted users
+        """
+        query = Q()
+        if self.staff:
+            query |= Q(is_staff=True)
+        if self.superusers:
+            query |= Q(is_superuser=True)
+        if self.group_names:
+            query |= Q(groups__name__in=self.group_names)
+        self.loaded_at = time.monotonic()
+        self.user_ids = frozenset(get_user_model().objects.filter(query).values_list('pk', flat=True))
+
+
+def to_timestamp(value):
+    """
+    Return the epoch timestamp of the datetime `value`, read in the current time zone if it's naive
+    """
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.timestamp()
+
+
+class ActivationTimeline:
+    """
+    When a revision is active: enabled, and within its activation window
+
+    The window boundaries are turned into a sorted list of transitions once per
+    revision. Checking a time then only compares it with the next transition,
+    and the state is only recomputed once that transition is passed, so times
+    are expected to only move forward. They are epoch timestamps rather than
+    monotonic clock readings, so that all the processes switch at the same moment.
+    """
+
+    def __init__(self, enabled, active_from=None, active_until=None):
+        # (time, whether the revision is active from that time)
+        self.transitions = []
+        if enabled:
+            if active_from is not None:
+                self.transitions.append((to_timestamp(active_from), True))
+            if active_until is not None:
+                self.transitions.append((to_timestamp(active_until), False))
+        self.transitions.sort()
+        self.initially_active = enabled and active_from is None
+        self.active = self.initially_active
+        self.next_transition = self.transitions[0][0] if self.transitions else math.inf
+
+    def is_active(self, now):
+        """
+        Determine if the revision is active at the epoch timestamp `now`
+        """
+        if now >= self.next_transition:
+            self.advance(now)
+        return self.active
+
+    def advance(self, now):
+        """
+        Recompute the state and the next transition for the epoch timestamp `now`
+        """
+        active, next_transition = self.initially_active, math.inf
+        for transition, active_after in self.transitions:
+            if now < transition:
+                next_transition = transition
+                break
+            active = active_after
+        # Threads seeing the new transition time before the new state would just advance again
+        self.active = active
+        self.next_transition = next_transition
+
+
+def load_exemption_lists(config):
+    """
+    Return the values of the exemption lists of `config` by exemption kind, and
+    whether its usernames are too many to be loaded, and left in the database
+
+    Revisions without exemption rows (not saved yet, or saved before the rows
+    existed) are read from their comma-separated fields.
+    """
+    lists = {kind: [] for kind in EXEMPTION_KINDS.values()}
+    usernames_in_db = False
+    if config.pk is not None:
+        rows = config.exemptions.all()
+        max_usernames = getattr(settings, 'SPLASH_MAX_IN_MEMORY_USERNAMES', None)
+        if max_usernames is not None:
+            if rows.filter(kind=AbstractSplashExemption.USERNAME).count() > max_usernames:
+                usernames_in_db = True
+                # An empty username, matching anonymous users, is still loaded
+                rows = rows.exclude(Q(kind=AbstractSplashExemption.USERNAME) & ~Q(value=''))
+        for kind, value in rows.values_list('kind', 'value'):
+            lists[kind].append(value)
+    if not usernames_in_db and not any(lists.values()):
+        for field, kind in EXEMPTION_KINDS.items():
+            lists[kind] = split_values(getattr(config, field))
+    return lists, usernames_in_db
+
+
+def load_username_filter(config, username_rows):
+    """
+    Return a Bloom filter of the usernames of `config` left in the database
+
+    When `SPLASH_USERNAME_BLOOM_FILTER_DIR` is set, the filter is mapped from
+    the file of the revision in that directory, or built and saved there for
+    the other workers, removing the files of the revisions it supersedes.
+    Files are saved with a key made of the revision ID, the number of
+    usernames and the IDs of their rows, so that a file left by another
+    database with the same revision IDs isn't used.
+    """
+    usernames = username_rows.values_list('value', flat=True)
+    directory = getattr(settings, 'SPLASH_USERNAME_BLOOM_FILTER_DIR', None)
+    if not directory:
+        return BloomFilter.build(usernames.iterator(), username_rows.count())
+
+    prefix = '-'.join([type(config).__name__.lower()] + [getattr(config, field) for field in config.KEY_FIELDS])
+    rows = username_rows.aggregate(count=Count('id'), first=Min('id'), last=Max('id'))
+    key = hashlib.blake2b(
+        f"{prefix}:{config.pk}:{rows['count']}:{rows['first']}:{rows['last']}".encode(), digest_size=KEY_SIZE
+    ).digest()
+    path = os.path.join(directory, f'{prefix}-{config.pk}.bloom')
+    try:
+        return BloomFilter.load(path, key)
+    except FileNotFoundError:
+        pass
+    except (OSError, BloomFilterError) as error:
+        log.warning('Rebuilding the username Bloom filter: %s', error)
+
+    username_filter = BloomFilter.build(usernames.iterator(), rows['count'])
+    try:
+        username_filter.save(path, key)
+    except OSError as error:
+        log.warning('Unable to save the username Bloom filter: %s', error)
+    else:
+        remove_superseded_filters(directory, prefix, config.pk)
+    return username_filter
+
+
+def remove_superseded_filters(directory, prefix, revision):
+    """
+    Remove the username Bloom filter files named with `prefix` of the revisions older than `revision`
+
+    Workers which mapped them keep their copy until they unmap it.
+    """
+    pattern = re.compile(re.escape(prefix) + r'-(\d+)\.bloom')
+    for name in os.listdir(directory):
+        match = pattern.fullmatch(name)
+        if match and int(match.group(1)) < revision:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                log.warning('Unable to remove the username Bloom filter %s: %s', name, error)
+
+
+class SplashSnapshot:
+    """
+    Parsed, read-only view of a `SplashConfig` revision
+
+    `exemption_lists` may be passed if they were already loaded with `load_exemption_lists(config)`.
+    """
+
+    def __init__(self, config, exemption_lists=None):
+        self.revision = config.pk
+        self.enabled = config.enabled
+        self.timeline = ActivationTimeline(config.enabled, config.active_from, config.active_until)
+        self.cookie_name = config.cookie_name
+        lists, usernames_in_db = exemption_lists or load_exemption_lists(config)
+        # Usernames left in the database are looked up one by one
+        self.username_rows = (
+            config.exemptions.filter(kind=AbstractSplashExemption.USERNAME) if usernames_in_db else None
+        )
+        self.cookie_allowed_values = frozenset(lists[AbstractSplashExemption.COOKIE_VALUE])
+        self.unaffected_usernames = frozenset(lists[AbstractSplashExemption.USERNAME])
+        if self.username_rows is not None and getattr(settings, 'SPLASH_USERNAME_BLOOM_FILTER', False):
+            self.username_filter = load_username_filter(config, self.username_rows)
+        else:
+            self.username_filter = None
+        group_names = lists[AbstractSplashExemption.GROUP]
+        if config.unaffected_staff or config.unaffected_superusers or group_names:
+            self.exempt_users = ExemptUsers(config.unaffected_staff, config.unaffected_superusers, group_names)
+        else:
+            self.exempt_users = None
+        # Whether the user has to be loaded to decide on requests
+        self.checks_users = (
+            bool(self.unaffected_usernames) or self.username_rows is not None or self.exempt_users is not None
+        )
+        # Cookies whose presence may exempt a request, for the exemption hint header
+        self.exemption_hint = config.cookie_name
+        if self.checks_users:
+            self.exemption_hint += f', {settings.SESSION_COOKIE_NAME}'
+        self.path_matcher = PathMatcher(lists[AbstractSplashExemption.URL_PATH])
+        self.redirect_url = config.redirect_url
+        # Served instead of redirecting, rendered and compressed once per revision
+        self.landing_page = LandingPage.render(config) if config.landing_page else None
+        # Path and query string of the redirect URL, as `request.get_full_path()` would return them
+        redirect_parts = urlsplit(config.redirect_url)
+        self.redirect_full_path = redirect_parts.path + (f'?{redirect_parts.query}' if redirect_parts.query else '')
+        self.token_verifier = (
+            TokenVerifier(config.cookie_name, config.signed_cookie_max_age) if config.signed_cookie else None
+        )
+        # Visitors whose key hashes below the threshold are in the rollout. Raising the
+        # percentage keeps the visitors who were already in.
+        if config.rollout_percentage < 100:
+            self.rollout_threshold = config.rollout_percentage * 2 ** 32 // 100
+        else:
+            self.rollout_threshold = None
+        # A new snapshot comes with an empty cache, so cached decisions never outlive their revision
+        decision_cache_size = getattr(settings, 'SPLASH_DECISION_CACHE_SIZE', 0)
+        self.decision_cache = LRUCache(decision_cache_size) if decision_cache_size else None
+
+    def is_active(self, now=None):
+        """
+        Determine if the splash screen is active at the epoch timestamp `now` (defaults to the current time)
+        """
+        return self.timeline.is_active(time.time() if now is None else now)
+
+    def exemption(self, path, cookie_value):
+        """
+        Return why a request for `path` with the splash cookie set to `cookie_value`
+        goes through whoever the user is, None if it doesn't
+        """
+        exemption = self.static_exemption(path, cookie_value in self.cookie_allowed_values)
+        if exemption is None and self.token_verifier is not None and self.token_verifier.verify(cookie_value):
+            return COOKIE_OK
+        return exemption
+
+    def static_exemption(self, path, allowed_cookie):
+        """
+        The part of `exemption` which only depends on the revision: the path, and whether the cookie
+        value is one of the allowed ones
+        """
+        # Some URLs should never be redirected
+        if self.path_matcher.matches(path):
+            return EXEMPT_PATH
+        if allowed_cookie:
+            return COOKIE_OK
+        return None
+
+    def is_sampled_out(self, key):
+        """
+        Determine if the visitor identified by the string `key` is outside the rollout
+        """
+        return self.rollout_threshold is not None and zlib.crc32(key.encode()) >= self.rollout_threshold
+
+    def is_exempt_user(self, user):
+        """
+        Determine if `user` should never be redirected
+        """
+        if user.username in self.unaffected_usernames:
+            return True
+        if not user.is_authenticated:
+            return False
+        if self.exempt_users is not None and user.pk in self.exempt_users.user_ids:
+            return True
+        return self.may_be_exempt_username(user.username) and self.username_rows.filter(value=user.username).exists()
+
+    def may_be_exempt_username(self, username):
+        """
+        Determine if `username` has to be looked up in the usernames left in the database
+        """
+        if self.username_rows is None:
+            return False
+        return self.username_filter is None or username in self.username_filter
+
+    async def ais_exempt_user(self, user):
+        """
+        Async version of `is_exempt_user`
+
+        Only looking the username up in the database hops to a thread.
+        """
+        if user.is_authenticated and self.may_be_exempt_username(user.username):
+            return await sync_to_async(self.is_exempt_user)(user)
+        return self.is_exempt_user(user)
+
+    def cached_exemption(self, path, cookie_value):
+        """
+        `exemption`, memoized in the decision cache when it's enabled
+
+        Only the part depending on the revision is memoized: signed tokens expire.
+        """
+        if self.decision_cache is None:
+            return self.exemption(path, cookie_value)
+
+        key = (path, cookie_value in self.cookie_allowed_values)
+        exemption = self.decision_cache.get(key, _MISSING)
+        if exemption is _MISSING:
+            exemption = self.static_exemption(*key)
+            self.decision_cache.set(key, exemption)
+        if exemption is None and self.token_verifier is not None and self.token_verifier.verify(cookie_value):
+            return COOKIE_OK
+        return exemption
+
+
+class SnapshotStore:
+    """
+    Holds the snapshots of the current configurations for this process: the
+    global one, and the ones of the hosts with a `SiteSplashConfig`
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.host_snapshots = {}
+        self.checked_at = 0.0
+        self.check_interval = None
+        self.shared = _MISSING
+        self.invalidated = False
+        # Whether a new revision was notified since the configurations were last read
+        self.notified = False
+        # Generation of the shared snapshot the snapshots were built from, and its revisions
+        self.shared_generation = None
+        self.shared_revisions = None
+        self.invalidation = _MISSING
+        # Process the invalidation listener was started in
+        self.subscribed_pid = None
+
+    def get_fresh(self, request=None):
+        """
+        Return the snapshot for `request` if it doesn't need to be checked, None otherwise
+        """
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self.checked_at < self.get_check_interval():
+            if not self.invalidated:
+                return self.select(snapshot, request)
+        return None
+
+    def get(self, request=None):
+        """
+        Return the snapshot for `request`, rebuilding it if the configuration changed
+        """
+        return self.fetch(request)[0]
+
+    def fetch(self, request=None):
+        """
+        Return the snapshot for `request`, and where the global configuration was read from
+        """
+        snapshot = self.get_fresh(request)
+        if snapshot is not None:
+            return snapshot, SOURCE_SNAPSHOT
+
+        now = time.monotonic()
+        # Only the exempt users need refreshing while no new revision is notified
+        subscribed = self.subscribe()
+        shared = self.get_shared()
+        states = source = None
+        if subscribed and not self.invalidated and self.snapshot is not None:
+            source = SOURCE_SNAPSHOT
+        elif shared is not None:
+            try:
+                states, source = self.read_shared(shared)
+            except (OSError, SharedSnapshotError, pickle.UnpicklingError) as error:
+                log.warning('Unable to use the shared splash snapshot: %s', error)
+        if source is None:
+            # A notification arriving while reading gets this read again
+            self.invalidated = False
+            config, site_configs, source = self.read_configs()
+            states = [(config, None)] + [(site_config, None) for site_config in site_configs]
+
+        if states is None:
+            snapshot, host_snapshots = self.snapshot, self.host_snapshots
+        else:
+            snapshot, host_snapshots = self.build(states)
+        for new_snapshot in (snapshot, *host_snapshots.values()):
+            if new_snapshot.exempt_users is not None and new_snapshot.exempt_users.is_stale(now):
+                new_snapshot.exempt_users.load()
+        self.snapshot, self.host_snapshots = snapshot, host_snapshots
+        self.checked_at = now
+        return self.select(snapshot, request), source
+
+    def read_configs(self):
+        """
+        Return the current global and site configurations, and where the global one was read from
+
+        After a notification they're read from the database: a process reading
+        them between the save and the commit of the new revision may have cached
+        the previous one again.
+        """
+        if self.notified:
+            self.notified = False
+            TieredCache.delete_all_tiers(SplashConfig.cache_key_name())
+            TieredCache.delete_all_tiers(SITE_CONFIGS_CACHE_KEY)
+        cached_response = TieredCache.get_cached_response(SplashConfig.cache_key_name())
+        if cached_response.is_found and cached_response.value is not None:
+            config, source = cached_response.value, SOURCE_CACHE
+        else:
+            config, source = SplashConfig.current(), SOURCE_DB
+        return config, get_site_configs(), source
+
+    def build(self, states):
+        """
+        Return the global snapshot and the host snapshots for `states`, a list of
+        (configuration, exemption lists or None) pairs starting with the global
+        configuration, reusing the current snapshots of unchanged revisions
+        """
+        (config, exemption_lists), *site_states = states
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.revision != config.pk:
+            snapshot = SplashSnapshot(config, exemption_lists)
+
+        host_snapshots = {}
+        for site_config, site_exemption_lists in site_states:
+            host_snapshot = self.host_snapshots.get(site_config.host)
+            if host_snapshot is None or host_snapshot.revision != site_config.pk:
+                host_snapshot = SplashSnapshot(site_config, site_exemption_lists)
+            host_snapshots[site_config.host] = host_snapshot
+        return snapshot, host_snapshots
+
+    def read_shared(self, shared):
+        """
+        Return the states of the shared snapshot if they changed (None otherwise), and where they were read from
+
+        The process taking the lock once the last check is too old checks for
+        new revisions, and publishes them. Returns no source if the snapshots
+        have to be built from the configurations, without a shared snapshot.
+        """
+        generation, checked_at = shared.read()
+        # A new revision saved by this process is published right away
+        if self.invalidated or time.time() - checked_at >= self.get_check_interval():
+            with shared.locked() as leader:
+                if leader:
+                    self.invalidated = False
+                    return self.check_shared(shared)
+        if generation == 0:
+            return None, None
+        if generation == self.shared_generation and self.snapshot is not None:
+            return None, SOURCE_SHARED
+        payload = shared.load(generation)
+        self.shared_generation, self.shared_revisions = generation, payload['revisions']
+        return payload['states'], SOURCE_SHARED
+
+    def check_shared(self, shared):
+        """
+        Check for new revisions, and publish them in the shared snapshot. Called with its lock held.
+        """
+        generation, _ = shared.read()
+        payload = None
+        if generation and generation != self.shared_generation:
+            payload = shared.load(generation)
+            self.shared_generation, self.shared_revisions = generation, payload['revisions']
+        config, site_configs, source = self.read_configs()
+        configs = [config, *site_configs]
+        revisions = [(type(config).__name__, config.pk) for config in configs]
+        if generation and revisions == self.shared_revisions:
+            shared.touch(time.time())
+            if payload is None and self.snapshot is None:
+                payload = shared.load(generation)
+            return (None if payload is None else payload['states']), source
+
+        states = [(config, load_exemption_lists(config)) for config in configs]
+        self.shared_generation = shared.publish({'revisions': revisions, 'states': states}, time.time())
+        self.shared_revisions = revisions
+        return states, source
+
+    def get_shared(self):
+        """
+        Return the `SharedSnapshotFile` of `SPLASH_SHARED_SNAPSHOT_PATH`, or None if it isn't set
+        """
+        if self.shared is _MISSING:
+            path = getattr(settings, 'SPLASH_SHARED_SNAPSHOT_PATH', None)
+            self.shared = SharedSnapshotFile(path) if path else None
+        return self.shared
+
+    def warm_up(self):
+        """
+        Build the snapshots of the current configurations and compile their matchers ahead of the first request
+        """
+        self.fetch()
+        for snapshot in (self.snapshot, *self.host_snapshots.values()):
+            snapshot.path_matcher.compile()
+
+    def get_invalidation(self):
+        """
+        Return the `InvalidationBackend` of `SPLASH_INVALIDATION_BACKEND`, or None if it isn't set
+        """
+        if self.invalidation is _MISSING:
+            self.invalidation = get_invalidation_backend()
+        return self.invalidation
+
+    def subscribe(self):
+        """
+        Listen to the invalidation channel if there's one, returning whether this process listens to it
+
+        The listener is started again in processes forked after it was started.
+        """
+        invalidation = self.get_invalidation()
+        if invalidation is None:
+            return False
+        pid = os.getpid()
+        if self.subscribed_pid != pid:
+            self.subscribed_pid = pid
+            invalidation.subscribe(self.notify)
+            # Revisions may have been saved before listening
+            self.invalidated = True
+        return True
+
+    def notify(self, message):
+        """
+        Handle the message of a new revision from the invalidation channel
+        """
+        log.debug('Splash configuration invalidated: %s', message)
+        self.notified = True
+        self.invalidate()
+
+    def select(self, snapshot, request):
+        """
+        Return the snapshot of the host of `request` if it has one, the global `snapshot` otherwise
+        """
+        host_snapshots = self.host_snapshots
+        if host_snapshots and request is not None:
+            return host_snapshots.get(split_domain_port(request.get_host())[0], snapshot)
+        return snapshot
+
+    def get_check_interval(self):
+        """
+        Number of seconds during which a snapshot is used without checking for a new revision
+        """
+        if self.check_interval is None:
+            self.check_interval = getattr(settings, 'SPLASH_CONFIG_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        return self.check_interval
+
+    def invalidate(self):
+        """
+        Drop the current snapshot, so that it gets rebuilt on next access
+        """
+        self.snapshot = None
+        self.invalidated = True
+
+
+def get_site_configs():
+    """
+    Return the current `SiteSplashConfig` of every host, loaded in one query and cached
+    """
+    cached_response = TieredCache.get_cached_response(SITE_CONFIGS_CACHE_KEY)
+    if cached_response.is_found:
+        return cached_response.value
+
+    site_configs = list(SiteSplashConfig.objects.current_set())
+    TieredCache.set_all_tiers(SITE_CONFIGS_CACHE_KEY, site_configs, SiteSplashConfig.cache_timeout)
+    return site_configs
+
+
+_store = SnapshotStore()
+
+
+def get_snapshot(request=None):
+    """
+    Return the `SplashSnapshot` of the current configuration for `request`
+    (the global configuration if no request is given)
+    """
+    return _store.get(request)
+
+
+def fetch_snapshot(request=None):
+    """
+    Return the `SplashSnapshot` of the current configuration for `request`, and where the
+    global configuration was read from: `SOURCE_SNAPSHOT`, `SOURCE_CACHE` or `SOURCE_DB`
+    """
+    return _store.fetch(request)
+
+
+async def aget_snapshot(request=None):
+    """
+    Async version of `get_snapshot`
+    """
+    return (await afetch_snapshot(request))[0]
+
+
+async def afetch_snapshot(request=None):
+    """
+    Async version of `fetch_snapshot`
+
+    Only checking for a new revision hops to a thread, to access the cache and the database.
+    """
+    snapshot = _store.get_fresh(request)
+    if snapshot is not None:
+        return snapshot, SOURCE_SNAPSHOT
+    return await sync_to_async(_store.fetch)(request)
+
+
+def warm_up():
+    """
+    Load the current configurations ahead of the first request, so that it doesn't pay for it
+
+    Fails soft, returning False, when the database isn't reachable or the
+    snapshots can't be built: the configurations are then loaded by the first
+    request, as without warm-up. The database connections opened are closed,
+    so that processes forked afterwards (e.g. by `gunicorn --preload`) don't
+    share them.
+    """
+    try:
+        _store.warm_up()
+    except DatabaseError as error:
+        log.warning('Unable to warm up the splash configuration: %s', error)
+        return False
+    except Exception:  # pylint: disable=broad-except
+        log.exception('Unable to warm up the splash configuration')
+        return False
+    finally:
+        connections.close_all()
+    return True
+
+
+def invalidate_snapshot():
+    """
+    Force the snapshot to be rebuilt on next access
+    """
+    _store.invalidate()
+
+
+@receiver(post_save, sender=SplashConfig)
+def _invalidate_on_save(**kwargs):
+    """
+    Drop the snapshot when a new configuration revision is saved
+
+    `SplashConfig.current()` is only cleared from the cache once `save` returns,
+    so the snapshot is rebuilt lazily rather than here.
+    """
+    invalidate_snapshot()
+
+
+@receiver(post_save, sender=SiteSplashConfig)
+def _invalidate_on_site_save(**kwargs):
+    """
+    Drop the cached site configurations and the snapshot when a site configuration is saved
+    """
+    TieredCache.delete_all_tiers(SITE_CONFIGS_CACHE_KEY)
+    invalidate_snapshot()
+
+
+@receiver(config_saved)
+def _publish_on_save(sender, instance, **kwargs):
+    """
+    Notify the processes listening to the invalidation channel of a new revision, once it's committed
+    """
+    invalidate_snapshot()
+    invalidation = _store.get_invalidation()
+    if invalidation is not None:
+        message = f'{sender.__name__}:{instance.pk}'
+        transaction.on_commit(lambda: _publish(invalidation, message))
+
+
+def _publish(invalidation, message):
+    """
+    Publish `message` on `invalidation`, logging failures: the revision is saved regardless
+    """
+    try:
+        invalidation.publish(message)
+    except Exception:  # pylint: disable=broad-except
+        log.exception('Unable to publish the splash configuration invalidation %s', message)
+
+
+@receiver(setting_changed)
+def _reset_check_interval(setting, **kwargs):
+    """
+    Reload the check interval when it's overridden, e.g. in tests
+    """
+    if setting == 'SPLASH_CONFIG_CHECK_INTERVAL':
+        _store.check_interval = None
+    elif setting == 'SPLASH_SHARED_SNAPSHOT_PATH':
+        _store.shared = _MISSING
+        _store.shared_generation = _store.shared_revisions = None
+    elif setting in ('SPLASH_INVALIDATION_BACKEND', 'SPLASH_INVALIDATION_OPTIONS'):
+        _store.invalidation = _MISSING
+        _store.subscribed_pid = None
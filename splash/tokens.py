@@ -0,0 +1,70 @@
+"""
+Splash screen - Signed cookie tokens
+
+When a configuration has `signed_cookie` enabled, the splash cookie holds a
+token issued by the `accept` view instead of one of the allowed values: a
+random value signed with HMAC (`django.core.signing.TimestampSigner`, keyed
+by `SECRET_KEY`) along with the time it was issued. A token is valid for
+`signed_cookie_max_age` seconds after being issued.
+
+The signature is checked with a constant-time comparison. Verified tokens
+are then kept with their expiry in an LRU cache of the snapshot, so that a
+token is usually verified once per process and revision.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import get_random_string
+
+from .lru import LRUCache
+
+DEFAULT_VERIFIED_TOKENS_CACHE_SIZE = 1024
+
+
+def get_signer(cookie_name):
+    """
+    Return the signer of the tokens of the cookie `cookie_name`
+    """
+    return signing.TimestampSigner(salt=f'splash.tokens:{cookie_name}')
+
+
+def issue_token(cookie_name):
+    """
+    Return a new token for the cookie `cookie_name`
+    """
+    return get_signer(cookie_name).sign(get_random_string(16))
+
+
+class TokenVerifier:
+    """
+    Verifies the tokens of the cookie `cookie_name`, valid for `max_age` seconds
+    """
+
+    def __init__(self, cookie_name, max_age):
+        self.signer = get_signer(cookie_name)
+        self.max_age = max_age
+        cache_size = getattr(settings, 'SPLASH_VERIFIED_TOKENS_CACHE_SIZE', DEFAULT_VERIFIED_TOKENS_CACHE_SIZE)
+        # Expiry time of the recently verified tokens
+        self.verified = LRUCache(cache_size) if cache_size else None
+
+    def verify(self, token):
+        """
+        Determine if `token` is a valid, unexpired token
+        """
+        if not token:
+            return False
+        now = time.time()
+        if self.verified is not None:
+            expires_at = self.verified.get(token)
+            if expires_at is not None:
+                return now < expires_at
+
+        try:
+            self.signer.unsign(token, max_age=self.max_age)
+        except signing.BadSignature:
+            return False
+        if self.verified is not None:
+            issued_at = signing.b62_decode(token.rsplit(self.signer.sep, 2)[1])
+            self.verified.set(token, issued_at + self.max_age)
+        return True
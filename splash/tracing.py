@@ -0,0 +1,146 @@
+"""
+Splash screen - Decision tracing
+
+Setting `SPLASH_TRACE_SAMPLE_RATE` to a number between 0 and 1 traces that
+share of the requests going through `SplashMiddleware`: the time spent in each
+phase of the check, and the rule which decided on the request (the outcome).
+The last `SPLASH_TRACE_BUFFER_SIZE` traces (default: 1000) of each process are
+kept in memory, and can be read from the `splash:traces` view (staff only) or
+produced for synthetic requests with the `splash_trace` management command.
+
+Phases, in order (a request stops at the phase deciding on it):
+
+* `config_fetch`: getting the configuration snapshot
+* `activation`: checking whether the splash screen is active
+* `path_match`: matching the path against the unaffected URL paths
+* `cookie_check`: checking the splash cookie, including signed tokens
+* `redirect_url`: checking whether the request is for the redirect URL
+* `rollout`: picking whether the visitor is part of the rollout
+* `user`: loading the user and checking whether they're exempted
+* `response`: building the redirect response
+
+Traced requests bypass the decision cache, so that the path and cookie checks
+are timed apart. Without sampling, the middleware doesn't look at tracing
+past a single attribute check.
+"""
+import random
+import time
+from collections import deque
+from time import perf_counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_BUFFER_SIZE = 1000
+
+CONFIG_FETCH = 'config_fetch'
+ACTIVATION = 'activation'
+PATH_MATCH = 'path_match'
+COOKIE_CHECK = 'cookie_check'
+REDIRECT_URL_CHECK = 'redirect_url'
+ROLLOUT = 'rollout'
+USER = 'user'
+RESPONSE = 'response'
+PHASES = (CONFIG_FETCH, ACTIVATION, PATH_MATCH, COOKIE_CHECK, REDIRECT_URL_CHECK, ROLLOUT, USER, RESPONSE)
+
+
+class Trace:
+    """
+    Timings of the phases of the check of a request, in seconds
+    """
+    __slots__ = ('started_at', 'method', 'path', 'revision', 'source', 'outcome', 'phases', 'last')
+
+    def __init__(self, request):
+        self.started_at = time.time()
+        self.method = request.method
+        self.path = request.path_info
+        self.revision = self.source = self.outcome = None
+        self.phases = {}
+        self.last = perf_counter()
+
+    def mark(self, phase):
+        """
+        Record the time since the previous phase as the time of `phase`
+        """
+        now = perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+
+    def as_dict(self):
+        """
+        Return the trace as a JSON-serializable dict
+        """
+        return {
+            'time': self.started_at,
+            'method': self.method,
+            'path': self.path,
+            'revision': self.revision,
+            'source': self.source,
+            'outcome': self.outcome,
+            'phases': dict(self.phases),
+            'total': sum(self.phases.values()),
+        }
+
+
+class Tracer:
+    """
+    Samples `sample_rate` of the requests, and keeps the last `buffer_size` traces
+    """
+
+    def __init__(self, sample_rate, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        # Appending to a bounded deque is atomic, and drops the oldest trace
+        self.traces = deque(maxlen=buffer_size)
+
+    def start(self, request):
+        """
+        Return a new `Trace` for `request` if it's sampled, None otherwise
+        """
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return Trace(request)
+        return None
+
+    def record(self, trace):
+        """
+        Add a finished `trace` to the buffer
+        """
+        self.traces.append(trace)
+
+    def dump(self):
+        """
+        Return the traces in the buffer as dicts, oldest first
+        """
+        return [trace.as_dict() for trace in list(self.traces)]
+
+    def clear(self):
+        """
+        Empty the buffer
+        """
+        self.traces.clear()
+
+
+_tracer = None
+
+
+def get_tracer():
+    """
+    Return the `Tracer` of this process if `SPLASH_TRACE_SAMPLE_RATE` is set, None otherwise
+    """
+    global _tracer  # pylint: disable=global-statement
+    sample_rate = getattr(settings, 'SPLASH_TRACE_SAMPLE_RATE', 0)
+    if not sample_rate:
+        return None
+    if _tracer is None:
+        _tracer = Tracer(sample_rate, getattr(settings, 'SPLASH_TRACE_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+    return _tracer
+
+
+@receiver(setting_changed)
+def _reset_tracer(setting, **kwargs):
+    """
+    Create the tracer again when its settings are overridden, e.g. in tests
+    """
+    global _tracer  # pylint: disable=global-statement
+    if setting in ('SPLASH_TRACE_SAMPLE_RATE', 'SPLASH_TRACE_BUFFER_SIZE'):
+        _tracer = None
@@ -0,0 +1,13 @@
+"""
+URLs of the splash screen application
+"""
+from django.urls import path
+
+from . import views
+
+app_name = 'splash'
+
+urlpatterns = [
+    path('accept/', views.accept, name='accept'),
+    path('traces/', views.traces, name='traces'),
+]
@@ -0,0 +1,54 @@
+"""
+Views of the splash screen application
+"""
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_safe
+
+from .snapshot import get_snapshot
+from .tokens import issue_token
+from .tracing import get_tracer
+
+
+@require_safe
+def accept(request):
+    """
+    Set the splash cookie to a new signed token, and redirect to the `next` URL (or to the site root)
+
+    Linked from the splash screen, for configurations with `signed_cookie` enabled.
+    Its path must be one of the unaffected URL paths.
+    """
+    snapshot = get_snapshot(request)
+    if snapshot.token_verifier is None:
+        raise Http404('Signed splash cookies are not enabled')
+
+    next_url = request.GET.get('next', '/')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()},
+                                           require_https=request.is_secure()):
+        next_url = '/'
+    response = HttpResponseRedirect(next_url)
+    response.set_cookie(
+        snapshot.cookie_name,
+        issue_token(snapshot.cookie_name),
+        max_age=snapshot.token_verifier.max_age,
+        secure=request.is_secure(),
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
+
+@require_safe
+def traces(request):
+    """
+    Return the decision traces of this process as JSON, to staff users only
+
+    Each worker process has its own traces: successive requests may be served by different ones.
+    """
+    if not (request.user.is_active and request.user.is_staff):
+        raise PermissionDenied
+    tracer = get_tracer()
+    if tracer is None:
+        raise Http404('Splash decision tracing is not enabled')
+    return JsonResponse({'sample_rate': tracer.sample_rate, 'traces': tracer.dump()})
@@ -1,9 +1,10 @@
 """ ROOT_URLCONF for tests """
-from django.urls import re_path
+from django.urls import include, re_path
 
 from test_utils import views
 
 
 urlpatterns = [
     re_path(r'^home', views.home, name='home'),
+    re_path(r'^splash/', include('splash.urls')),
 ]
@@ -0,0 +1,4 @@
+""" Instrumentation hook used only for tests """
+from unittest.mock import Mock
+
+hook = Mock()
@@ -0,0 +1,108 @@
+"""
+Splash - Async middleware tests
+"""
+from unittest.mock import patch
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import AsyncRequestFactory
+
+from splash.middleware import SplashMiddleware
+from splash.models import SplashConfig
+from splash.snapshot import aget_snapshot, invalidate_snapshot
+
+User = get_user_model()
+
+
+async def get_response(request):
+    """
+    Async view standing for the rest of the middleware chain
+    """
+    return HttpResponse('ok')
+
+
+class AsyncSplashMiddlewareTestCase(TestCase):
+    """
+    Tests for the async code path of the splash middleware
+    """
+
+    def setUp(self):
+        super().setUp()
+        invalidate_snapshot()
+        self.splash_middleware = SplashMiddleware(get_response)
+        self.request_factory = AsyncRequestFactory(SERVER_NAME='example.org')
+
+    def build_request(self, user=None, cookies=None, url_path='/somewhere'):
+        """
+        Builds a new async request
+        """
+        request = self.request_factory.get(url_path)
+        request.user = user or AnonymousUser()
+        if cookies is not None:
+            request.COOKIES = cookies
+        return request
+
+    def test_async_mode(self):
+        """
+        The middleware switches to async mode with an async `get_response`
+        """
+        assert iscoroutinefunction(self.splash_middleware)
+
+    async def test_redirect(self):
+        """
+        No cookie present should redirect
+        """
+        await sync_to_async(SplashConfig(enabled=True).save)()
+
+        response = await self.splash_middleware(self.build_request())
+        assert response.status_code == 302
+        assert response['Location'] == 'http://edx.org'
+
+    async def test_right_cookie_without_thread(self):
+        """
+        Once the snapshot is built, the request is checked without hopping to a thread
+        """
+        await sync_to_async(SplashConfig(enabled=True).save)()
+        await aget_snapshot()
+
+        with patch('splash.snapshot.sync_to_async') as snapshot_sync_to_async, \
+                patch('splash.middleware.sync_to_async') as middleware_sync_to_async:
+            response = await self.splash_middleware(self.build_request(cookies={'edx_splash_screen': 'seen'}))
+        assert response.content == b'ok'
+        assert not snapshot_sync_to_async.called
+        assert not middleware_sync_to_async.called
+
+    async def test_unaffected_user(self):
+        """
+        Unaffected users should never be redirected
+        """
+        await sync_to_async(SplashConfig(enabled=True, unaffected_usernames='user1').save)()
+        user = await sync_to_async(User.objects.create_user)('user1', 'test@example.com', 'user1')
+
+        response = await self.splash_middleware(self.build_request(user=user))
+        assert response.content == b'ok'
+
+    async def test_not_unaffected_user(self):
+        """
+        Setting unaffected users should still redirect other users
+        """
+        await sync_to_async(SplashConfig(enabled=True, unaffected_usernames='user1').save)()
+        user = await sync_to_async(User.objects.create_user)('user2', 'test@example.com', 'user2')
+
+        response = await self.splash_middleware(self.build_request(user=user))
+        assert response.status_code == 302
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=0)
+    async def test_unaffected_user_in_database(self):
+        """
+        Usernames left in the database are looked up from a thread
+        """
+        await sync_to_async(SplashConfig(enabled=True, unaffected_usernames='user1').save)()
+        user = await sync_to_async(User.objects.create_user)('user1', 'test@example.com', 'user1')
+
+        response = await self.splash_middleware(self.build_request(user=user))
+        assert response.content == b'ok'
@@ -0,0 +1,89 @@
+"""
+Splash - Bloom filter tests
+"""
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from splash.bloom import BloomFilter, BloomFilterError
+
+
+class BloomFilterTestCase(SimpleTestCase):
+    """
+    Tests for the Bloom filter
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_no_false_negatives(self):
+        """
+        Every value added is reported as present
+        """
+        values = [f'user{index}' for index in range(10000)]
+        bloom_filter = BloomFilter.build(values, len(values))
+
+        assert all(value in bloom_filter for value in values)
+
+    def test_false_positive_rate(self):
+        """
+        Values which weren't added are rarely reported as present
+        """
+        bloom_filter = BloomFilter.build((f'user{index}' for index in range(10000)), 10000, error_rate=0.01)
+
+        false_positives = sum(f'other{index}' in bloom_filter for index in range(10000))
+        assert false_positives < 200
+
+    def test_empty(self):
+        """
+        An empty filter holds nothing
+        """
+        assert 'user1' not in BloomFilter.build([], 0)
+
+    def test_save_and_load(self):
+        """
+        A saved filter is mapped back from its file with the same contents
+        """
+        path = os.path.join(self.directory, 'usernames.bloom')
+        bloom_filter = BloomFilter.build(['user1', 'user2'], 2)
+        bloom_filter.save(path)
+
+        loaded = BloomFilter.load(path)
+        assert (loaded.num_bits, loaded.num_hashes) == (bloom_filter.num_bits, bloom_filter.num_hashes)
+        assert 'user1' in loaded
+        assert 'user2' in loaded
+        assert os.listdir(self.directory) == ['usernames.bloom']
+
+    def test_load_other_key(self):
+        """
+        Files saved with another key than the expected one are rejected
+        """
+        path = os.path.join(self.directory, 'usernames.bloom')
+        BloomFilter.build(['user1', 'user2'], 2).save(path, b'revision-1')
+
+        assert 'user1' in BloomFilter.load(path, b'revision-1')
+        for key in (b'', b'revision-2'):
+            with self.assertRaises(BloomFilterError):
+                BloomFilter.load(path, key)
+
+    def test_load_invalid_file(self):
+        """
+        Files which don't hold a filter are rejected
+        """
+        path = os.path.join(self.directory, 'usernames.bloom')
+        with open(path, 'wb') as output:
+            output.write(b'SPLB' + b'\0' * 100)
+
+        with self.assertRaises(BloomFilterError):
+            BloomFilter.load(path)
+
+        # Empty or truncated, e.g. while another worker writes it
+        for content in (b'', b'SPLB'):
+            with open(path, 'wb') as output:
+                output.write(content)
+            with self.assertRaises(BloomFilterError):
+                BloomFilter.load(path)
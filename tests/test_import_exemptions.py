@@ -0,0 +1,145 @@
+"""
+Splash - Exemptions import tests
+"""
+import json
+import math
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from splash.exemptions import NormalizedExemptions
+from splash.models import SiteSplashConfig, SplashConfig, SplashExemption
+
+User = get_user_model()
+
+
+class NormalizedExemptionsTestCase(TestCase):
+    """
+    Tests for the validation of exemption lists
+    """
+
+    def test_normalization(self):
+        """
+        Values are stripped and deduplicated, and invalid ones rejected
+        """
+        normalized = NormalizedExemptions(
+            'unaffected_url_paths',
+            [' /a/* ', '/b', '', '/a/*', 'no-slash', '/c,/d', '*.json', '/' * 256, '/c /d'],
+        )
+        assert normalized.values == ['/a/*', '/b', '*.json']
+        assert normalized.duplicates == 1
+        assert [value for value, _ in normalized.rejected] == ['no-slash', '/c,/d', '/' * 256, '/c /d']
+        assert normalized.as_field_value() == '/a/*,/b,*.json'
+
+    def test_usernames(self):
+        """
+        Usernames can't contain whitespace, unlike group names
+        """
+        assert NormalizedExemptions('unaffected_usernames', ['user1', 'user 2']).values == ['user1']
+        assert NormalizedExemptions('unaffected_groups', ['beta testers']).values == ['beta testers']
+
+    def test_cookie_values(self):
+        """
+        Cookie values can't contain separators
+        """
+        normalized = NormalizedExemptions('cookie_allowed_values', ['ok', 'not ok', 'a;b'])
+        assert normalized.values == ['ok']
+        assert len(normalized.rejected) == 2
+
+
+class ImportExemptionsCommandTestCase(TestCase):
+    """
+    Tests for the splash_import_exemptions management command
+    """
+
+    def write_file(self, suffix, content):
+        """
+        Write `content` into a temporary file, returning its path
+        """
+        file_descriptor, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(file_descriptor, 'w') as temp_file:
+            temp_file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def call_command(self, *args):
+        """
+        Run the command, returning its output
+        """
+        out = StringIO()
+        call_command('splash_import_exemptions', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_csv(self):
+        """
+        A CSV file replaces the lists it contains in a single new revision, keeping the other fields
+        """
+        SplashConfig(enabled=True, unaffected_usernames='old', unaffected_url_paths='/keep').save()
+        usernames = '\n'.join(f'unaffected_usernames,user{index % 5000}' for index in range(5100))
+        rejected = f"unaffected_usernames,{'x' * 256}\nunaffected_usernames,bad,name\nnope,x\n"
+        path = self.write_file('.csv', f'field,value\n{usernames}\n{rejected}')
+
+        # Current configuration, the new revision, and its 5001 exemption rows inserted in batches within a savepoint
+        batch_size = min(1000, connection.ops.bulk_batch_size(['config', 'kind', 'value'], [None] * 1000))
+        with self.assertNumQueries(4 + math.ceil(5001 / batch_size)):
+            output = self.call_command(path)
+
+        assert 'unaffected_usernames: 5000 values, 1 rejected, 100 duplicates' in output
+        assert '2 values rejected for unknown fields or malformed rows' in output
+        assert SplashConfig.objects.count() == 2
+        config = SplashConfig.current()
+        assert config.enabled
+        assert config.unaffected_url_paths == '/keep'
+        assert len(config.unaffected_usernames_list) == 5000
+        assert config.exemptions.filter(kind=SplashExemption.USERNAME).count() == 5000
+        assert config.changed_by is None
+
+    def test_json_append(self):
+        """
+        With --append, the values are added to the current ones
+        """
+        SplashConfig(enabled=True, unaffected_url_paths='/a/*').save()
+        User.objects.create_user('admin')
+        path = self.write_file('.json', json.dumps({'unaffected_url_paths': ['/b/*', '/a/*', 'bad']}))
+
+        output = self.call_command(path, '--append', '--username', 'admin')
+
+        assert 'unaffected_url_paths: 2 values, 1 rejected, 1 duplicates' in output
+        config = SplashConfig.current()
+        assert config.unaffected_url_paths == '/a/*,/b/*'
+        assert config.changed_by.username == 'admin'
+
+    def test_yaml_host(self):
+        """
+        YAML files can be imported into a site configuration
+        """
+        path = self.write_file('.yml', 'cookie_allowed_values:\n  - ok1\n  - ok2\n')
+
+        self.call_command(path, '--host', 'Example.org')
+
+        assert SiteSplashConfig.current('example.org').cookie_allowed_values == 'ok1,ok2'
+        assert not SplashConfig.objects.exists()
+
+    def test_dry_run(self):
+        """
+        Nothing is saved on a dry run
+        """
+        path = self.write_file('.csv', 'unaffected_groups,beta\n')
+        output = self.call_command(path, '--dry-run')
+        assert 'unaffected_groups: 1 values, 0 rejected, 0 duplicates' in output
+        assert not SplashConfig.objects.exists()
+
+    def test_invalid_file(self):
+        """
+        Files which aren't mappings of lists are refused
+        """
+        path = self.write_file('.json', json.dumps({'unaffected_usernames': 'user1,user2'}))
+        with self.assertRaises(CommandError):
+            self.call_command(path)
+        with self.assertRaises(CommandError):
+            self.call_command(self.write_file('.txt', ''))
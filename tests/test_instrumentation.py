@@ -0,0 +1,76 @@
+"""
+Splash - Instrumentation tests
+"""
+from unittest.mock import Mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+
+from splash.middleware import SplashMiddleware
+from splash.models import SplashConfig
+from splash.snapshot import invalidate_snapshot
+from test_utils.instrumentation import hook
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Tests for the instrumentation hook of the splash middleware
+    """
+
+    def setUp(self):
+        super().setUp()
+        hook.reset_mock()
+        invalidate_snapshot()
+        self.request_factory = RequestFactory(SERVER_NAME='example.org')
+
+    def process_request(self, cookies=None):
+        """
+        Run a request through a new middleware, returning the metrics reported as (metric, tags) pairs
+        """
+        request = self.request_factory.get('/somewhere')
+        request.user = AnonymousUser()
+        if cookies is not None:
+            request.COOKIES = cookies
+        SplashMiddleware(Mock()).process_request(request)
+        return [(call.args[0], call.args[2]) for call in hook.call_args_list]
+
+    @override_settings(SPLASH_INSTRUMENTATION='test_utils.instrumentation.hook')
+    def test_outcomes_and_sources(self):
+        """
+        The hook gets the configuration source and the outcome of each request
+        """
+        SplashConfig(enabled=True).save()
+
+        assert self.process_request() == [
+            ('splash.config_fetch', {'source': 'db'}),
+            ('splash.decision', {'outcome': 'redirect'}),
+        ]
+        hook.reset_mock()
+        assert self.process_request(cookies={'edx_splash_screen': 'seen'}) == [
+            ('splash.config_fetch', {'source': 'snapshot'}),
+            ('splash.decision', {'outcome': 'cookie-ok'}),
+        ]
+        assert all(call.args[1] >= 0 for call in hook.call_args_list)
+
+    @override_settings(SPLASH_INSTRUMENTATION='test_utils.instrumentation.hook', SPLASH_CONFIG_CHECK_INTERVAL=0)
+    def test_cache_source(self):
+        """
+        Configurations found in the cache are reported as such
+        """
+        SplashConfig(enabled=False).save()
+        self.process_request()
+        hook.reset_mock()
+
+        assert self.process_request() == [
+            ('splash.config_fetch', {'source': 'cache'}),
+            ('splash.decision', {'outcome': 'disabled'}),
+        ]
+
+    def test_disabled_by_default(self):
+        """
+        Without the setting, nothing gets reported
+        """
+        SplashConfig(enabled=True).save()
+        assert SplashMiddleware(Mock()).instrument is None
+        assert not self.process_request()
@@ -0,0 +1,183 @@
+"""
+Splash - Invalidation channel tests
+"""
+import os
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+from edx_django_utils.cache import TieredCache
+
+from django.test import TestCase, override_settings
+
+from splash.invalidation import FileInvalidationBackend, SocketInvalidationBackend
+from splash.models import SiteSplashConfig, SplashConfig
+from splash.snapshot import SOURCE_DB, SOURCE_SNAPSHOT, SnapshotStore, _store
+
+
+def wait_for(condition, timeout=5):
+    """
+    Wait for `condition()` to be true, failing after `timeout` seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.01)
+
+
+class InvalidationTestMixin:
+    """
+    Tests for an invalidation backend, each process being simulated by a `SnapshotStore`
+    """
+    backend = None
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(
+            SPLASH_INVALIDATION_BACKEND=f'{self.backend.__module__}.{self.backend.__name__}',
+            SPLASH_INVALIDATION_OPTIONS=self.get_options(),
+            # Checked on every request without the channel
+            SPLASH_CONFIG_CHECK_INTERVAL=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_options(self):
+        """
+        Keyword arguments of the backend
+        """
+        raise NotImplementedError
+
+    def test_kept_until_notified(self):
+        """
+        Processes keep their snapshots without reading the configuration until a new revision is saved
+        """
+        SplashConfig(enabled=True).save()
+        SiteSplashConfig(host='example.org', enabled=True).save()
+        stores = [SnapshotStore(), SnapshotStore()]
+        for store in stores:
+            assert store.fetch()[0].enabled
+
+        with self.assertNumQueries(0), patch.object(TieredCache, 'get_cached_response') as get_cached_response:
+            for store in stores:
+                snapshot, source = store.fetch()
+                assert source == SOURCE_SNAPSHOT
+                assert snapshot is store.snapshot
+        get_cached_response.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SplashConfig(enabled=False).save()
+        for store in stores:
+            wait_for(lambda store=store: store.invalidated)
+            assert not store.fetch()[0].enabled
+            assert store.fetch()[1] == SOURCE_SNAPSHOT
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteSplashConfig(host='example.org', enabled=False).save()
+        for store in stores:
+            wait_for(lambda store=store: store.invalidated)
+            store.fetch()
+            assert not store.host_snapshots['example.org'].enabled
+
+    def test_cached_before_commit(self):
+        """
+        Notified processes read the new revision from the database, even if the previous one was cached again
+        """
+        SplashConfig(enabled=True).save()
+        store = SnapshotStore()
+        assert store.fetch()[0].enabled
+        previous = SplashConfig.current()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            SplashConfig(enabled=False).save()
+        # Read by another process between the save and the commit
+        TieredCache.set_all_tiers(SplashConfig.cache_key_name(), previous, SplashConfig.cache_timeout)
+        for callback in callbacks:
+            callback()
+
+        wait_for(lambda: store.invalidated)
+        snapshot, source = store.fetch()
+        assert not snapshot.enabled
+        assert source == SOURCE_DB
+        assert not SplashConfig.current().enabled
+
+    def test_forked(self):
+        """
+        The listener is started again in a forked process, which reads the configuration again
+        """
+        SplashConfig(enabled=True).save()
+        store = SnapshotStore()
+        store.fetch()
+        with patch.object(self.backend, 'subscribe') as subscribe, patch('os.getpid', return_value=-1):
+            assert store.fetch()[1] != SOURCE_SNAPSHOT
+        subscribe.assert_called_once_with(store.notify)
+
+
+class FileInvalidationTestCase(InvalidationTestMixin, TestCase):
+    """
+    Tests for the file invalidation backend
+    """
+    backend = FileInvalidationBackend
+
+    def get_options(self):
+        return {'path': os.path.join(self.directory, 'invalidation'), 'poll_interval': 0.01}
+
+
+class SocketInvalidationTestCase(InvalidationTestMixin, TestCase):
+    """
+    Tests for the Unix socket invalidation backend
+    """
+    backend = SocketInvalidationBackend
+
+    def get_options(self):
+        return {'directory': self.directory}
+
+    def test_stale_socket(self):
+        """
+        Sockets left behind by exited processes are removed
+        """
+        path = os.path.join(self.directory, 'exited.sock')
+        backend = SocketInvalidationBackend(self.directory)
+        with open(path, 'wb'):
+            pass
+
+        backend.publish('SplashConfig:1')
+        assert not os.path.exists(path)
+
+
+class PublishTestCase(TestCase):
+    """
+    Tests for the publication of new revisions
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(_store, 'invalidation', MagicMock())
+        self.invalidation = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_published_on_commit(self):
+        """
+        New revisions are published once committed
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            config = SplashConfig(enabled=True)
+            config.save()
+        self.invalidation.publish.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        self.invalidation.publish.assert_called_once_with(f'SplashConfig:{config.pk}')
+
+    def test_publish_failure(self):
+        """
+        Failing to publish a revision is logged, and doesn't fail saving it
+        """
+        self.invalidation.publish.side_effect = ConnectionError
+        with self.assertLogs('splash.snapshot', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            SplashConfig(enabled=True).save()
+        assert SplashConfig.current().enabled
@@ -0,0 +1,151 @@
+"""
+Splash - Landing page tests
+"""
+import gzip
+from unittest.mock import Mock, patch
+
+from edx_django_utils.cache import TieredCache
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.urls import NoReverseMatch
+
+from splash.landing import LandingPage, accepted_encodings
+from splash.middleware import SplashMiddleware
+from splash.models import SplashConfig
+from splash.proxy_rules import build_proxy_rules
+from splash.snapshot import get_snapshot, invalidate_snapshot
+
+
+class LandingPageTestCase(TestCase):
+    """
+    Tests for the landing page served by the middleware
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        self.splash_middleware = SplashMiddleware(Mock())
+        self.request_factory = RequestFactory(SERVER_NAME='example.org')
+        SplashConfig(enabled=True, landing_page=True, landing_message='Launching on Monday').save()
+
+    def process_request(self, **headers):
+        """
+        Run an anonymous request with the given headers through the middleware
+        """
+        request = self.request_factory.get('/somewhere', **headers)
+        request.user = AnonymousUser()
+        return self.splash_middleware.process_request(request)
+
+    def test_served(self):
+        """
+        The landing page is served instead of the redirect, uncompressed by default
+        """
+        response = self.process_request()
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/html; charset=utf-8'
+        assert b'<p>Launching on Monday</p>' in response.content
+        assert response['Content-Length'] == str(len(response.content))
+        assert not response.has_header('Content-Encoding')
+        assert response['ETag'].startswith('"')
+        assert response['Vary'] == 'Accept-Encoding, Cookie'
+
+    def test_compressed(self):
+        """
+        The compressed variant accepted by the client is served, with its own ETag
+        """
+        identity = self.process_request()
+        response = self.process_request(HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == identity.content
+        assert response['ETag'] != identity['ETag']
+
+        assert not self.process_request(HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding')
+        assert accepted_encodings('br;q=0.5, GZIP, identity;q=0') == frozenset(['br', 'gzip'])
+
+    def test_brotli(self):
+        """
+        Brotli is preferred when it's installed and accepted
+        """
+        brotli = Mock(MODE_TEXT=1, compress=Mock(return_value=b'br'))
+        with patch('splash.landing.brotli', brotli):
+            page = LandingPage(b'<p>' * 100)
+        assert page.select('gzip, br') == 'br'
+        assert page.select('gzip') == 'gzip'
+        assert page.select('*') == 'br'
+        assert page.select('') == 'identity'
+        # An explicit q=0 overrides the wildcard
+        assert page.select('*, br;q=0') == 'gzip'
+        assert page.select('gzip;q=0, *') == 'br'
+        assert LandingPage(b'<p>' * 100).select('*, gzip;q=0') == 'identity'
+        assert LandingPage(b'<p>').select('gzip') == 'identity'
+
+    def test_not_modified(self):
+        """
+        Repeat visits with the ETag get a 304, until a new revision is saved
+        """
+        etag = self.process_request(HTTP_ACCEPT_ENCODING='gzip')['ETag']
+
+        with patch('splash.landing.render_to_string') as render_to_string:
+            response = self.process_request(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'"x", W/{etag}')
+        render_to_string.assert_not_called()
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        assert not response.content
+        # The uncompressed variant has another ETag
+        assert self.process_request(HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+        SplashConfig(enabled=True, landing_page=True, landing_message='Launching on Tuesday').save()
+        response = self.process_request(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    @override_settings(SPLASH_REDIRECT_CACHE_CONTROL={'public': True, 'max_age': 60})
+    def test_cache_control(self):
+        """
+        The landing page gets the headers of the redirect
+        """
+        assert SplashMiddleware(Mock()).process_request(self.request_factory.get('/')).get(
+            'Cache-Control') == 'public, max-age=60'
+
+    def test_accept_url(self):
+        """
+        With signed cookies, the page links to the accept view
+        """
+        SplashConfig(enabled=True, landing_page=True, signed_cookie=True).save()
+        assert b'href="/splash/accept/?next=%2F"' in self.process_request().content
+
+    def test_invalid_template(self):
+        """
+        Unknown templates are rejected, and redirect if they can't be rendered anymore
+        """
+        with self.assertRaises(ValidationError):
+            SplashConfig(enabled=True, landing_page=True, landing_template='missing.html').save()
+
+        config = SplashConfig(enabled=True, landing_page=True, landing_template='missing.html')
+        with self.assertLogs('splash.landing', 'ERROR'):
+            assert LandingPage.render(config) is None
+
+    def test_render_error(self):
+        """
+        Errors only raised while rendering are rejected too, and fall back to the redirect
+        """
+        with patch('splash.landing.render_to_string', side_effect=NoReverseMatch):
+            with self.assertRaises(ValidationError):
+                SplashConfig(enabled=True, landing_page=True).save()
+
+            # The revision saved in setUp, once its template fails
+            invalidate_snapshot()
+            with self.assertLogs('splash.landing', 'ERROR'):
+                snapshot = get_snapshot()
+        assert snapshot.landing_page is None
+        response = self.process_request()
+        assert response.status_code == 302
+
+    def test_proxy_rules(self):
+        """
+        Proxies leave landing pages to the middleware
+        """
+        assert not build_proxy_rules(get_snapshot())['enabled']
@@ -0,0 +1,102 @@
+"""
+Splash - Path matcher tests
+"""
+import random
+from itertools import product
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from splash.matcher import PathMatcher
+from splash.middleware import SplashMiddleware
+
+PATTERNS = [
+    '/test1/*',
+    '/test2/*/after',
+    '/test3/*/before/*/after',
+    '/my/url/',
+    '/*/xblock/*',
+    '/static/*.css',
+    '/a+b/(c)?',
+    '*',
+    '',
+]
+
+PATHS = [
+    '/',
+    '/test1/',
+    '/test1',
+    '/test1/something/else',
+    '/test2/after',
+    '/test2/something/after',
+    '/test2/something/after/',
+    '/test3/x/before/y/after',
+    '/test3/before/after',
+    '/my/url/',
+    '/my/url',
+    '/courses/xblock/handler',
+    '/xblock/',
+    '/static/main.css',
+    '/static/main.js',
+    '/a+b/(c)?',
+    '/aab/c',
+    '/test1/line\nbreak',
+    '/test2/x/after\n',
+]
+
+
+class PathMatcherTestCase(SimpleTestCase):
+    """
+    Tests for the compiled path matcher
+    """
+
+    def test_same_results_as_path_matches(self):
+        """
+        The compiled matcher agrees with `SplashMiddleware.path_matches` for
+        every single pattern, and for every combination of them
+        """
+        middleware = SplashMiddleware(Mock())
+        pattern_lists = [[pattern] for pattern in PATTERNS] + [PATTERNS[:3], PATTERNS[3:8], PATTERNS]
+        for patterns, path in product(pattern_lists, PATHS):
+            expected = any(middleware.path_matches(path, pattern) for pattern in patterns)
+            assert PathMatcher(patterns).matches(path) == expected, (patterns, path)
+
+    def test_random_same_results_as_path_matches(self):
+        """
+        The prefix trie doesn't change the results on random patterns and paths
+        """
+        middleware = SplashMiddleware(Mock())
+        rand = random.Random(42)
+
+        def random_string(alphabet):
+            return ''.join(rand.choice(alphabet) for _ in range(rand.randint(0, 8)))
+
+        for _ in range(200):
+            patterns = [random_string('/ab*.') for _ in range(rand.randint(1, 6))]
+            matcher = PathMatcher(patterns)
+            for _ in range(20):
+                path = '/' + random_string('/ab.')
+                expected = any(middleware.path_matches(path, pattern) for pattern in patterns)
+                assert matcher.matches(path) == expected, (patterns, path)
+                pattern = matcher.matching_pattern(path)
+                assert (pattern is not None) == expected, (patterns, path)
+                assert pattern is None or middleware.path_matches(path, pattern)
+
+    def test_prefix_index(self):
+        """
+        Wildcard patterns are indexed by the complete segments of their literal prefix
+        """
+        matcher = PathMatcher(['/api/v1/*', '/api/v2/*/x', '/static*', '*.css'])
+        assert matcher.root.patterns == ['*.css']
+        assert matcher.root.children[''].patterns == ['/static*']
+        assert matcher.root.children[''].children['api'].children['v1'].patterns == ['/api/v1/*']
+        assert matcher.matches('/api/v2/y/x')
+        assert not matcher.matches('/api/v3/y/x')
+
+    def test_empty(self):
+        """
+        An empty matcher never matches
+        """
+        matcher = PathMatcher([])
+        assert not matcher
+        assert not matcher.matches('/')
@@ -0,0 +1,277 @@
+"""
+Splash - Proxy rules tests
+"""
+import json
+import random
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from splash.middleware import SplashMiddleware
+from splash.models import SiteSplashConfig, SplashConfig
+from splash.proxy_rules import (ProxyRulesError, build_proxy_rules, compile_path_regexes, nginx_map_key, nginx_string,
+                                proxy_redirects, render_nginx)
+from splash.snapshot import REDIRECT, SplashSnapshot
+from splash.tokens import issue_token
+
+CONFIGS = [
+    {'enabled': False},
+    {'enabled': True},
+    {
+        'enabled': True,
+        'cookie_allowed_values': 'ok1,ok2',
+        'unaffected_url_paths': '/test1/*, /test2/*/after, /my/url/, /*/xblock/*, /static/*.css, /a+b/(c)?',
+    },
+    {
+        'enabled': True,
+        'cookie_allowed_values': 'ok1,,ok2',
+        'unaffected_url_paths': '*.json,/api/*',
+        'unaffected_usernames': 'user1',
+        'redirect_url': 'http://example.org/splash?from=edge',
+    },
+    {
+        'enabled': True,
+        'unaffected_usernames': 'user1,,user2',
+    },
+    {
+        'enabled': True,
+        'unaffected_groups': 'beta',
+        'redirect_url': 'http://example.org/splash',
+    },
+    {
+        'enabled': True,
+        'cookie_allowed_values': 'ok1',
+        'signed_cookie': True,
+    },
+    {
+        'enabled': True,
+        'rollout_percentage': 50,
+    },
+    {
+        'enabled': True,
+        'cookie_allowed_values': 'default,include,hostnames,volatile,~seen',
+    },
+]
+
+PATH_SEGMENTS = ['test1', 'test2', 'after', 'my', 'url', 'xblock', 'static', 'main.css', 'a+b', '(c)?', 'api',
+                 'data.json', 'splash', '']
+COOKIE_VALUES = [None, '', 'seen', 'ok1', 'ok2', 'ok3', 'default', '~seen', 'other', issue_token('edx_splash_screen')]
+
+
+def build_corpus(size):
+    """
+    Build a deterministic corpus of (path, query string, splash cookie value, has session) tuples
+    """
+    rand = random.Random(1234)
+    corpus = []
+    for _ in range(size):
+        path = '/' + '/'.join(rand.choice(PATH_SEGMENTS) for _ in range(rand.randint(0, 4)))
+        query = rand.choice(['', '', 'from=edge', 'a=1'])
+        corpus.append((path, query, rand.choice(COOKIE_VALUES), rand.random() < 0.2))
+    return corpus
+
+
+CORPUS = build_corpus(3000)
+
+NGINX_MAP = re.compile(r'^map (\S+) (\$\w+) \{\n(.*?)^\}', re.MULTILINE | re.DOTALL)
+NGINX_MAP_ENTRY = re.compile(r'(?:"((?:[^"\\]|\\.)*)"|(\S+)) (\S+);')
+
+
+def parse_nginx_maps(nginx):
+    """
+    Read the map blocks of nginx rules the way nginx does, as a list of
+    (source, variable, default, {string: value}, [(regex, value)]) in order
+    """
+    maps = []
+    for source, variable, body in NGINX_MAP.findall(nginx):
+        default, strings, regexes = '', {}, []
+        for line in body.splitlines():
+            quoted, bare, value = NGINX_MAP_ENTRY.fullmatch(line.strip()).groups()
+            key = bare if quoted is None else re.sub(r'\\(.)', r'\1', quoted)
+            if key == 'default':
+                default = value
+            elif key.startswith('~'):
+                regexes.append((re.compile(key[1:]), value))
+            else:
+                assert key not in ('hostnames', 'include', 'volatile'), key
+                strings[(key[1:] if key.startswith('\\') else key).lower()] = value
+        maps.append((source, variable, default, strings, regexes))
+    return maps
+
+
+def nginx_redirects(maps, variables):
+    """
+    Evaluate the parsed nginx map blocks `maps` with the request `variables`, as nginx does
+    """
+    variables = dict(variables)
+    for source, variable, default, strings, regexes in maps:
+        key = re.sub(r'\$(\w+)', lambda match: variables.get(match.group(1), ''), source)
+        value = strings.get(key.lower())
+        if value is None:
+            value = next((value for regex, value in regexes if regex.search(key)), default)
+        variables[variable[1:]] = value
+    return variables['splash_redirect'] == '1'
+
+
+class ProxyRulesParityTestCase(TestCase):
+    """
+    The proxy rules must redirect exactly the requests the middleware redirects, except the
+    ones they can't decide on (see `splash.proxy_rules`), which they leave to the middleware
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.splash_middleware = SplashMiddleware(lambda request: None)
+        self.request_factory = RequestFactory(SERVER_NAME='example.org')
+
+    def test_parity(self):
+        """
+        The reference evaluation of the rules matches the middleware decisions on the corpus
+        """
+        for config_values in CONFIGS:
+            snapshot = SplashSnapshot(SplashConfig(**config_values))
+            rules = json.loads(json.dumps(build_proxy_rules(snapshot)))
+            path_regexes = compile_path_regexes(rules)
+            nginx_maps = parse_nginx_maps(render_nginx(rules))
+
+            for path, query, cookie_value, has_session in CORPUS:
+                request = self.request_factory.get(path, QUERY_STRING=query)
+                request.user = AnonymousUser()
+                cookies = {}
+                if cookie_value is not None:
+                    cookies['edx_splash_screen'] = cookie_value
+                if has_session:
+                    cookies['sessionid'] = 'session-key'
+                request.COOKIES = cookies
+
+                middleware_redirects = self.splash_middleware.decide(snapshot, request) == REDIRECT
+                redirects = proxy_redirects(
+                    rules, request.path_info, cookies, request.build_absolute_uri(), path_regexes
+                )
+                case = (config_values, path, query, cookie_value, has_session)
+                variables = {
+                    'uri': request.path_info,
+                    'scheme': request.scheme,
+                    'http_host': request.get_host(),
+                    'request_uri': request.get_full_path(),
+                    **{f'cookie_{name}': value for name, value in cookies.items()},
+                }
+                assert nginx_redirects(nginx_maps, variables) == redirects, case
+                if has_session and snapshot.checks_users:
+                    # The user may be exempted, the proxy lets the middleware decide
+                    assert not redirects, case
+                elif cookie_value is None and '' in snapshot.cookie_allowed_values:
+                    # The proxy reads the missing cookie as an empty one, the middleware decides
+                    assert not redirects, case
+                elif snapshot.rollout_threshold is not None:
+                    # The proxy can't sample visitors, the middleware decides
+                    assert not redirects, case
+                elif cookie_value and rules['signed_cookie']:
+                    # The proxy can't verify signed values, the middleware decides
+                    assert not redirects, case
+                else:
+                    assert redirects == middleware_redirects, case
+
+    def test_nginx_signed_cookie(self):
+        """
+        With signed cookie values, any cookie value lets the request through the proxy
+        """
+        rules = build_proxy_rules(SplashSnapshot(SplashConfig(enabled=True, signed_cookie=True)))
+        nginx = render_nginx(rules)
+
+        assert 'map $cookie_edx_splash_screen $splash_cookie_ok {\n    default 1;\n    "" 0;\n}' in nginx
+
+    def test_activation_window(self):
+        """
+        The reference evaluation follows the activation window, which nginx rules can't express
+        """
+        start = timezone.now()
+        config = SplashConfig(enabled=True, active_from=start, active_until=start + timedelta(hours=1))
+        snapshot = SplashSnapshot(config)
+        rules = build_proxy_rules(snapshot)
+        boundary = snapshot.timeline.transitions[0][0]
+
+        assert not proxy_redirects(rules, '/x', {}, 'http://example.org/x', now=boundary - 1)
+        assert proxy_redirects(rules, '/x', {}, 'http://example.org/x', now=boundary)
+        assert not proxy_redirects(rules, '/x', {}, 'http://example.org/x', now=boundary + 3600)
+        with self.assertRaises(ProxyRulesError):
+            render_nginx(rules)
+
+    def test_nginx_strings(self):
+        """
+        Strings are escaped the way nginx reads them
+        """
+        assert nginx_string('~^/a\\.b/.*$') == '"~^/a\\\\.b/.*$"'
+        assert nginx_string('say "hi"') == '"say \\"hi\\""'
+
+    def test_nginx_map_keys(self):
+        """
+        Map keys nginx would read as parameters or regular expressions are escaped
+        """
+        for key in ('default', 'hostnames', 'include', 'volatile', '~seen', '\\seen'):
+            assert nginx_map_key(key) == nginx_string('\\' + key)
+        assert nginx_map_key('seen') == '"seen"'
+
+        rules = build_proxy_rules(SplashSnapshot(SplashConfig(enabled=True, cookie_allowed_values='default,~seen')))
+        nginx = render_nginx(rules)
+        assert 'map $cookie_edx_splash_screen $splash_cookie_ok {\n    default 0;\n    "\\\\default" 1;\n' in nginx
+        assert '    "\\\\~seen" 1;\n' in nginx
+
+
+class ProxyRulesCommandTestCase(TestCase):
+    """
+    Tests for the splash_proxy_rules management command
+    """
+
+    def call_command(self, *args):
+        """
+        Run the command, returning its output
+        """
+        out = StringIO()
+        call_command('splash_proxy_rules', *args, stdout=out)
+        return out.getvalue()
+
+    def test_nginx(self):
+        """
+        The nginx rules list the exemptions and the redirect
+        """
+        SplashConfig(
+            enabled=True,
+            cookie_allowed_values='ok1,ok2',
+            unaffected_url_paths='/heartbeat,/api/*',
+            redirect_url='http://example.com',
+        ).save()
+
+        output = self.call_command()
+        assert '    "/heartbeat" 1;\n' in output
+        assert '    "~^/api/.*$" 1;\n' in output
+        assert 'map $cookie_edx_splash_screen $splash_cookie_ok {' in output
+        assert '    "ok2" 1;\n' in output
+        assert '    "0000" 1;\n' in output
+        assert 'return 302 "http://example.com";' in output
+
+    def test_json_for_host(self):
+        """
+        The JSON rules can be generated for a site configuration
+        """
+        SplashConfig(enabled=True).save()
+        SiteSplashConfig(host='example.org', enabled=True, unaffected_usernames='user1').save()
+
+        rules = json.loads(self.call_command('--format', 'json', '--host', 'Example.org'))
+        assert rules['session_cookie_name'] == 'sessionid'
+        rules = json.loads(self.call_command('--format', 'json', '--host', 'other.example.org'))
+        assert rules['session_cookie_name'] is None
+
+    def test_invalid_cookie_name(self):
+        """
+        Cookie names nginx can't read are reported
+        """
+        SplashConfig(enabled=True, cookie_name='splash-screen').save()
+        with self.assertRaises(CommandError):
+            self.call_command()
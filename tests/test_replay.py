@@ -0,0 +1,164 @@
+"""
+Splash - Access log replay tests
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from splash.models import SplashConfig
+from splash.replay import Replayer, build_replay_snapshot, read_log, replay
+
+User = get_user_model()
+
+LOG = '''/somewhere
+/api/x\tseen
+/dashboard\tnot-seen\tuser1\t10.0.0.1
+/dashboard\t-\tstaff
+/a\tb\tc\td\te
+
+/heartbeat\t-\t-\t10.0.0.2
+'''
+
+
+class ReplayTestCase(TestCase):
+    """
+    Tests for the replay of access logs
+    """
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user('staff', is_staff=True)
+        self.config = SplashConfig(
+            enabled=True,
+            cookie_allowed_values='seen',
+            unaffected_usernames='user1',
+            unaffected_staff=True,
+            unaffected_url_paths='/api/*,/heartbeat',
+        )
+
+    def test_read_log(self):
+        """
+        Log lines are parsed into (path, cookie, username, IP address) entries, None for malformed lines
+        """
+        entries = list(read_log(StringIO(LOG)))
+        assert entries[0] == ('/somewhere', None, None, None)
+        assert entries[2] == ('/dashboard', 'not-seen', 'user1', '10.0.0.1')
+        assert entries[4] is None
+        assert len(entries) == 6
+
+        jsonl = '{"path": "/x", "username": "user1"}\n{"cookie": "seen"}\nnot json\n'
+        assert list(read_log(StringIO(jsonl), 'jsonl')) == [('/x', None, 'user1', None), None, None]
+
+    def test_replay(self):
+        """
+        Entries go through the decisions of the middleware, without loading the users
+        """
+        replayer = Replayer(build_replay_snapshot(self.config), 'example.org')
+        with self.assertNumQueries(0):
+            result, elapsed = replay(replayer, read_log(StringIO(LOG)), chunk_size=2)
+
+        assert elapsed > 0
+        assert result.requests == 5
+        assert result.malformed == 1
+        assert result.outcomes == {'redirect': 1, 'exempt-path': 2, 'exempt-user': 2}
+        assert result.redirect_rate == 0.2
+        assert result.rules == {
+            'redirect': 1,
+            'exempt-path /api/*': 1,
+            'exempt-path /heartbeat': 1,
+            'exempt-user (unaffected username)': 1,
+            'exempt-user (staff, superuser or group member)': 1,
+        }
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=0)
+    def test_usernames_in_database(self):
+        """
+        Usernames left in the database by the snapshots are loaded for the replay
+        """
+        self.config.save()
+        snapshot = build_replay_snapshot(SplashConfig.objects.get(pk=self.config.pk))
+        assert snapshot.unaffected_usernames == frozenset(['user1'])
+        assert snapshot.username_rows is None
+
+    def test_processes(self):
+        """
+        Replaying in a pool of processes gives the same result
+        """
+        replayer = Replayer(build_replay_snapshot(self.config), 'example.org')
+        result = replay(replayer, read_log(StringIO(LOG * 10)), processes=2, chunk_size=3)[0]
+        assert result.requests == 50
+        assert result.malformed == 10
+        assert result.outcomes['redirect'] == 10
+
+
+class ReplayCommandTestCase(TestCase):
+    """
+    Tests for the splash_replay management command
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'access.log')
+        with open(self.path, 'w', encoding='utf-8') as log_file:
+            log_file.write(LOG)
+
+    def call_command(self, *args):
+        """
+        Run the command on the log, returning its output
+        """
+        out = StringIO()
+        call_command('splash_replay', self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_candidate(self):
+        """
+        The candidate is the current configuration with the changes given, and isn't saved
+        """
+        SplashConfig(enabled=False).save()
+
+        assert 'Redirected: 0 (0.00%)' in self.call_command()
+        output = self.call_command('--set', 'enabled=1', '--set', 'unaffected_url_paths=/api/*,/heartbeat')
+        assert 'Requests: 5 (1 malformed lines skipped)' in output
+        assert 'Redirected: 3 (60.00%)' in output
+        assert '           3  redirect\n' in output
+        assert '           1  exempt-path /api/*\n' in output
+        assert 'requests/s' in output
+        assert SplashConfig.objects.count() == 1
+
+    def test_revision(self):
+        """
+        The candidate can start from another revision
+        """
+        SplashConfig(enabled=True).save()
+        revision = SplashConfig.current().pk
+        SplashConfig(enabled=False).save()
+
+        assert 'Redirected: 4 (80.00%)' in self.call_command('--revision', str(revision), '--processes', '2')
+
+    def test_invalid(self):
+        """
+        Unknown fields, invalid values and revisions are rejected
+        """
+        for args in (['--set', 'unknown=1'], ['--set', 'changed_by=1'], ['--set', 'enabled'],
+                     ['--set', 'enabled=maybe'], ['--set', 'rollout_percentage=101'], ['--revision', '404']):
+            with self.assertRaises(CommandError):
+                self.call_command(*args)
+
+    def test_jsonl(self):
+        """
+        JSON lines logs can be replayed
+        """
+        SplashConfig(enabled=True).save()
+        with open(self.path, 'w', encoding='utf-8') as log_file:
+            log_file.write(json.dumps({'path': '/x', 'cookie': 'seen'}) + '\n')
+
+        output = self.call_command('--format', 'jsonl')
+        assert 'Redirected: 0 (0.00%)' in output
+        assert '           1  cookie-ok seen\n' in output
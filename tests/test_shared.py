@@ -0,0 +1,116 @@
+"""
+Splash - Shared snapshot tests
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from edx_django_utils.cache import TieredCache
+
+from django.test import TestCase, override_settings
+
+from splash.models import SiteSplashConfig, SplashConfig
+from splash.shared import SharedSnapshotFile
+from splash.snapshot import SOURCE_DB, SOURCE_SHARED, SOURCE_SNAPSHOT, SnapshotStore
+
+
+class SharedSnapshotTestCase(TestCase):
+    """
+    Tests for the snapshot shared between processes, each process being simulated by a `SnapshotStore`
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'splash.snapshot')
+        settings_override = override_settings(SPLASH_SHARED_SNAPSHOT_PATH=self.path, SPLASH_CONFIG_CHECK_INTERVAL=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_published_once(self):
+        """
+        The first process publishes the configurations, which the others load without the cache or the database
+        """
+        SplashConfig(enabled=True, unaffected_usernames='user1', unaffected_url_paths='/api/*').save()
+        SiteSplashConfig(host='example.org', enabled=False).save()
+        leader, follower = SnapshotStore(), SnapshotStore()
+
+        snapshot, source = leader.fetch()
+        assert source == SOURCE_DB
+        assert snapshot.enabled
+        assert SharedSnapshotFile(self.path).read()[0] == 1
+
+        with self.assertNumQueries(0), patch.object(TieredCache, 'get_cached_response') as get_cached_response:
+            snapshot, source = follower.fetch()
+        get_cached_response.assert_not_called()
+        assert source == SOURCE_SHARED
+        assert snapshot.revision == SplashConfig.current().pk
+        assert snapshot.unaffected_usernames == frozenset(['user1'])
+        assert snapshot.path_matcher.matches('/api/x')
+        assert not follower.host_snapshots['example.org'].enabled
+        assert oct(os.stat(self.path).st_mode & 0o777) == '0o600'
+
+    def test_new_revision(self):
+        """
+        A new revision is published by the process checking for it, and picked up by the others
+        """
+        SplashConfig(enabled=True).save()
+        leader, follower = SnapshotStore(), SnapshotStore()
+        leader.fetch()
+        follower.fetch()
+
+        SplashConfig(enabled=False).save()
+        leader.invalidate()
+        assert not leader.fetch()[0].enabled
+        assert SharedSnapshotFile(self.path).read()[0] == 2
+
+        # The follower's own snapshot is still fresh
+        assert follower.fetch() == (follower.snapshot, SOURCE_SNAPSHOT)
+        follower.checked_at = 0.0
+        with self.assertNumQueries(0):
+            snapshot, source = follower.fetch()
+        assert source == SOURCE_SHARED
+        assert not snapshot.enabled
+
+    def test_unchanged_revisions(self):
+        """
+        Checking unchanged revisions doesn't publish a new generation
+        """
+        SplashConfig(enabled=True).save()
+        store = SnapshotStore()
+        snapshot = store.fetch()[0]
+
+        with override_settings(SPLASH_CONFIG_CHECK_INTERVAL=0):
+            assert store.fetch()[0] is snapshot
+        assert SharedSnapshotFile(self.path).read()[0] == 1
+        assert not os.path.exists(f'{self.path}.0')
+
+    def test_locked_without_generation(self):
+        """
+        A process which can't take the lock before anything is published reads the configuration itself
+        """
+        SplashConfig(enabled=True).save()
+        shared = SharedSnapshotFile(self.path)
+        shared.read()
+
+        with shared.locked() as leader:
+            assert leader
+            snapshot, source = SnapshotStore().fetch()
+        assert source == SOURCE_DB
+        assert snapshot.enabled
+        assert shared.read()[0] == 0
+
+    def test_invalid_header(self):
+        """
+        Invalid shared snapshots are ignored
+        """
+        SplashConfig(enabled=True).save()
+        with open(self.path, 'wb') as header:
+            header.write(b'\0' * 64)
+
+        with self.assertLogs('splash.snapshot', 'WARNING'):
+            snapshot, source = SnapshotStore().fetch()
+        assert source == SOURCE_DB
+        assert snapshot.enabled
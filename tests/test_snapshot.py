@@ -0,0 +1,468 @@
+"""
+Splash - Configuration snapshot tests
+"""
+import math
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+from edx_django_utils.cache import TieredCache
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Group
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from splash.bloom import BloomFilter
+from splash.middleware import SplashMiddleware
+from splash.models import SiteSplashConfig, SplashConfig, SplashExemption
+from splash.snapshot import COOKIE_OK, EXEMPT_PATH, SplashSnapshot, _store, get_snapshot, invalidate_snapshot, warm_up
+from splash.tokens import issue_token
+from test_utils.instrumentation import hook
+
+User = get_user_model()
+
+
+class SplashSnapshotTestCase(TestCase):
+    """
+    Tests for the in-process configuration snapshot
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        invalidate_snapshot()
+
+    def test_parsed_values(self):
+        """
+        The snapshot exposes the configuration values parsed once
+        """
+        SplashConfig(
+            enabled=True,
+            cookie_allowed_values='ok1, ok2',
+            unaffected_usernames='user1,user2 ',
+            unaffected_url_paths='/test1/*, /my/url/',
+            redirect_url='http://example.com',
+        ).save()
+
+        snapshot = get_snapshot()
+        assert snapshot.enabled
+        assert snapshot.cookie_allowed_values == frozenset(['ok1', 'ok2'])
+        assert snapshot.unaffected_usernames == frozenset(['user1', 'user2'])
+        assert snapshot.path_matcher.matches('/test1/something')
+        assert snapshot.redirect_url == 'http://example.com'
+
+    def test_reused_without_queries(self):
+        """
+        Once built, the snapshot is served from memory
+        """
+        SplashConfig(enabled=True).save()
+        snapshot = get_snapshot()
+        TieredCache.dangerous_clear_all_tiers()
+
+        with self.assertNumQueries(0):
+            assert get_snapshot() is snapshot
+
+    def test_rebuilt_on_save(self):
+        """
+        Saving a new configuration revision replaces the snapshot
+        """
+        SplashConfig(enabled=True).save()
+        snapshot = get_snapshot()
+        SplashConfig(enabled=False).save()
+
+        assert get_snapshot() is not snapshot
+        assert not get_snapshot().enabled
+
+    @override_settings(SPLASH_CONFIG_CHECK_INTERVAL=0)
+    def test_version_check(self):
+        """
+        Revisions saved by other processes are picked up by the version check,
+        and an unchanged revision keeps the same snapshot
+        """
+        SplashConfig(enabled=True).save()
+        snapshot = get_snapshot()
+        assert get_snapshot() is snapshot
+
+        # Simulate a save made in another process: no signal in this one
+        SplashConfig.objects.bulk_create([SplashConfig(enabled=False)])
+        TieredCache.dangerous_clear_all_tiers()
+
+        assert not get_snapshot().enabled
+
+    @override_settings(SPLASH_DECISION_CACHE_SIZE=2)
+    def test_decision_cache(self):
+        """
+        Path and cookie decisions are memoized per revision, in a bounded cache
+        """
+        SplashConfig(enabled=True, unaffected_url_paths='/test1/*').save()
+        snapshot = get_snapshot()
+
+        assert snapshot.cached_exemption('/test1/x', None) == EXEMPT_PATH
+        assert snapshot.cached_exemption('/test1/x', None) == EXEMPT_PATH
+        assert snapshot.cached_exemption('/test2/x', None) is None
+        assert snapshot.cached_exemption('/test2/x', 'seen') == COOKIE_OK
+        assert snapshot.decision_cache.info() == {'hits': 1, 'misses': 3, 'size': 2, 'maxsize': 2}
+
+        SplashConfig(enabled=True).save()
+        assert get_snapshot().decision_cache.info() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 2}
+        assert get_snapshot().cached_exemption('/test1/x', None) is None
+
+    @override_settings(SPLASH_DECISION_CACHE_SIZE=2)
+    def test_decision_cache_signed_cookie(self):
+        """
+        Signed cookie values are verified on top of the cached decisions, and don't fill the cache
+        """
+        SplashConfig(enabled=True, signed_cookie=True).save()
+        snapshot = get_snapshot()
+
+        for _ in range(3):
+            assert snapshot.cached_exemption('/x', issue_token('edx_splash_screen')) == COOKIE_OK
+        assert snapshot.cached_exemption('/x', 'invalid') is None
+        assert snapshot.cached_exemption('/x', 'seen') == COOKIE_OK
+        assert snapshot.decision_cache.info() == {'hits': 3, 'misses': 2, 'size': 2, 'maxsize': 2}
+
+    def test_no_decision_cache(self):
+        """
+        The decision cache is disabled by default
+        """
+        SplashConfig(enabled=True).save()
+        assert get_snapshot().decision_cache is None
+
+    @override_settings(SPLASH_CONFIG_CHECK_INTERVAL=0, SPLASH_EXEMPT_USERS_REFRESH_INTERVAL=0)
+    def test_exempt_users_refresh(self):
+        """
+        Exempt user IDs are loaded in one query, and reloaded when stale
+        """
+        SplashConfig(enabled=True, unaffected_staff=True, unaffected_groups='beta').save()
+        staff = User.objects.create_user('staff', is_staff=True)
+
+        # Global configuration, its exemption lists, site configurations and exempt users
+        with self.assertNumQueries(4):
+            snapshot = get_snapshot()
+        assert snapshot.exempt_users.user_ids == {staff.pk}
+
+        member = User.objects.create_user('member')
+        member.groups.add(Group.objects.create(name='beta'))
+        assert get_snapshot().exempt_users.user_ids == {staff.pk, member.pk}
+        assert get_snapshot().is_exempt_user(member)
+        assert not get_snapshot().is_exempt_user(User.objects.create_user('other'))
+
+    def test_exempt_users_not_reloaded(self):
+        """
+        Exempt user IDs are reused until their refresh interval is over
+        """
+        SplashConfig(enabled=True, unaffected_superusers=True).save()
+        get_snapshot()
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+        with self.assertNumQueries(0):
+            assert get_snapshot().exempt_users.user_ids == frozenset()
+
+    def test_exemption_rows(self):
+        """
+        Saving a revision stores its exemption lists as rows, loaded by the snapshot in one query
+        """
+        SplashConfig(enabled=True, unaffected_usernames='user1,user2,user1', unaffected_url_paths='/test1/*').save()
+        config = SplashConfig.current()
+        assert sorted(config.exemptions.values_list('kind', 'value')) == [
+            ('cookie_value', 'seen'), ('url_path', '/test1/*'), ('username', 'user1'), ('username', 'user2'),
+        ]
+
+        SplashConfig.objects.filter(pk=config.pk).update(unaffected_usernames='')
+        snapshot = get_snapshot()
+        assert snapshot.unaffected_usernames == frozenset(['user1', 'user2'])
+        assert snapshot.path_matcher.matches('/test1/x')
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=0)
+    def test_exemption_rows_case(self):
+        """
+        Exemption values differing by case are distinct rows, and looked up case-sensitively
+        """
+        SplashConfig(enabled=True, unaffected_usernames='Bob,bob,Alice').save()
+        snapshot = get_snapshot()
+        assert snapshot.is_exempt_user(User(username='bob'))
+        assert not snapshot.is_exempt_user(User(username='alice'))
+
+        value_field = SplashExemption._meta.get_field('value')
+        with patch.object(connection, 'vendor', 'mysql'):
+            assert value_field.db_type(connection).endswith(' COLLATE utf8mb4_bin')
+
+    def test_revision_without_rows(self):
+        """
+        Revisions without exemption rows are read from their comma-separated fields
+        """
+        SplashConfig.objects.bulk_create([SplashConfig(enabled=True, unaffected_usernames='user1')])
+
+        snapshot = get_snapshot()
+        assert snapshot.unaffected_usernames == frozenset(['user1'])
+        assert snapshot.cookie_allowed_values == frozenset(['seen'])
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=2)
+    def test_usernames_left_in_database(self):
+        """
+        Past the limit, usernames aren't loaded and users are looked up one by one
+        """
+        SplashConfig(enabled=True, unaffected_usernames='user1,user2,user3').save()
+        snapshot = get_snapshot()
+        assert snapshot.unaffected_usernames == frozenset()
+        assert snapshot.checks_users
+        assert snapshot.cookie_allowed_values == frozenset(['seen'])
+
+        with self.assertNumQueries(1):
+            assert snapshot.is_exempt_user(User(username='user3'))
+        with self.assertNumQueries(1):
+            assert not snapshot.is_exempt_user(User(username='user4'))
+        with self.assertNumQueries(0):
+            assert not snapshot.is_exempt_user(AnonymousUser())
+
+        # An empty username, exempting anonymous users, is loaded with the other lists
+        SplashConfig(enabled=True, unaffected_usernames='user1,,user2,user3').save()
+        snapshot = get_snapshot()
+        assert snapshot.unaffected_usernames == frozenset([''])
+        with self.assertNumQueries(0):
+            assert snapshot.is_exempt_user(AnonymousUser())
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=2, SPLASH_USERNAME_BLOOM_FILTER=True)
+    def test_username_bloom_filter(self):
+        """
+        The Bloom filter spares the lookup of most users who aren't in the list, and positives are confirmed
+        """
+        SplashConfig(enabled=True, unaffected_usernames='user1,user2,user3').save()
+        snapshot = get_snapshot()
+
+        with self.assertNumQueries(1):
+            assert snapshot.is_exempt_user(User(username='user3'))
+        with self.assertNumQueries(0):
+            assert not any(snapshot.is_exempt_user(User(username=f'other{index}')) for index in range(100))
+
+    @override_settings(SPLASH_MAX_IN_MEMORY_USERNAMES=2, SPLASH_USERNAME_BLOOM_FILTER=True)
+    def test_shared_username_bloom_filter(self):
+        """
+        The Bloom filter of a revision is built once, and mapped from its file by the other workers
+        """
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        SplashConfig(enabled=True, unaffected_usernames='user1,user2,user3').save()
+        config = SplashConfig.current()
+
+        with override_settings(SPLASH_USERNAME_BLOOM_FILTER_DIR=directory.name):
+            get_snapshot()
+            assert os.listdir(directory.name) == [f'splashconfig-{config.pk}.bloom']
+
+            # Counting the usernames, the other exemption lists, then the key of the file
+            with self.assertNumQueries(3):
+                snapshot = SplashSnapshot(config)
+            assert 'user1' in snapshot.username_filter
+
+            # Files built from other usernames, e.g. by another database with the same revision IDs, are rebuilt
+            path = os.path.join(directory.name, f'splashconfig-{config.pk}.bloom')
+            BloomFilter.build(['other'], 1).save(path)
+            with self.assertLogs('splash.snapshot', 'WARNING'):
+                snapshot = SplashSnapshot(config)
+            assert 'user3' in snapshot.username_filter
+            assert 'user3' in SplashSnapshot(config).username_filter
+
+            # Empty files, e.g. left by a crashed worker, are rebuilt too
+            open(path, 'wb').close()  # pylint: disable=consider-using-with
+            with self.assertLogs('splash.snapshot', 'WARNING'):
+                assert 'user3' in SplashSnapshot(config).username_filter
+
+            # The files of the revisions superseded by a new one are removed, not the ones of other hosts
+            SiteSplashConfig(host='example.org', enabled=True, unaffected_usernames='user1,user2,user3').save()
+            get_snapshot()
+            SplashConfig(enabled=True, unaffected_usernames='user1,user2,user4').save()
+            new_config = SplashConfig.current()
+            assert 'user4' in get_snapshot().username_filter
+            site_config = SiteSplashConfig.current('example.org')
+            assert sorted(os.listdir(directory.name)) == [
+                f'sitesplashconfig-example.org-{site_config.pk}.bloom', f'splashconfig-{new_config.pk}.bloom',
+            ]
+
+    def test_activation_window(self):
+        """
+        The activation window is evaluated against the precomputed timeline, without queries
+        """
+        start = datetime(2030, 1, 1, 12)
+        SplashConfig(enabled=True, active_from=start, active_until=start + timedelta(hours=1)).save()
+        snapshot = get_snapshot()
+        boundary = timezone.make_aware(start).timestamp()
+
+        with self.assertNumQueries(0):
+            assert not snapshot.is_active(boundary - 0.001)
+            assert snapshot.is_active(boundary)
+            assert snapshot.is_active(boundary + 3599.999)
+            assert not snapshot.is_active(boundary + 3600)
+        assert snapshot.timeline.next_transition == math.inf
+
+    def test_open_activation_windows(self):
+        """
+        Windows may only have a start or an end, and disabled revisions are never active
+        """
+        now = timezone.now()
+        SplashConfig(enabled=True, active_until=now).save()
+        assert get_snapshot().is_active(time.time() - 60)
+        assert not get_snapshot().is_active()
+
+        SplashConfig(enabled=True, active_from=now).save()
+        assert get_snapshot().is_active()
+
+        SplashConfig(enabled=False, active_from=now - timedelta(days=1)).save()
+        assert not get_snapshot().is_active()
+
+    def test_empty_activation_window(self):
+        """
+        The end of the activation window must be after its start
+        """
+        now = timezone.now()
+        with self.assertRaises(ValidationError):
+            SplashConfig(enabled=True, active_from=now, active_until=now).save()
+
+    def test_values_too_long(self):
+        """
+        Exemption values must fit in their rows
+        """
+        with self.assertRaises(ValidationError):
+            SplashConfig(unaffected_usernames='user1,' + 'x' * 256).save()
+
+
+@override_settings(ALLOWED_HOSTS=['.example.org', 'testserver'])
+class SiteSplashSnapshotTestCase(TestCase):
+    """
+    Tests for the snapshots of the site configurations
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        invalidate_snapshot()
+        self.addCleanup(TieredCache.dangerous_clear_all_tiers)
+        self.request_factory = RequestFactory()
+
+    def build_request(self, host):
+        """
+        Builds a request for `host`
+        """
+        return self.request_factory.get('/somewhere', HTTP_HOST=host)
+
+    def test_host_snapshots(self):
+        """
+        Hosts with a site configuration get its snapshot, other hosts the global one
+        """
+        SplashConfig(enabled=True, redirect_url='http://example.com/global').save()
+        SiteSplashConfig(host='Example.org', enabled=True, redirect_url='http://example.com/site').save()
+        SiteSplashConfig(host='other.example.org', enabled=False).save()
+
+        assert get_snapshot(self.build_request('example.org')).redirect_url == 'http://example.com/site'
+        assert get_snapshot(self.build_request('example.org:8000')).redirect_url == 'http://example.com/site'
+        assert not get_snapshot(self.build_request('other.example.org')).enabled
+        assert get_snapshot(self.build_request('testserver')).redirect_url == 'http://example.com/global'
+        assert get_snapshot().redirect_url == 'http://example.com/global'
+
+    def test_site_configs_loaded_once(self):
+        """
+        All the site configurations are loaded in a single query, then served from memory
+        """
+        SplashConfig(enabled=True).save()
+        for index in range(10):
+            SiteSplashConfig(host=f'site{index}.example.org', enabled=True).save()
+
+        # Global configuration and site configurations, and the exemption lists of each
+        with self.assertNumQueries(13):
+            get_snapshot()
+        with self.assertNumQueries(0):
+            for index in range(10):
+                assert get_snapshot(self.build_request(f'site{index}.example.org')).enabled
+
+    def test_site_config_revision(self):
+        """
+        Saving a site configuration replaces its snapshot only
+        """
+        SiteSplashConfig(host='example.org', enabled=True).save()
+        SiteSplashConfig(host='testserver', enabled=True).save()
+        example_snapshot = get_snapshot(self.build_request('example.org'))
+        testserver_snapshot = get_snapshot(self.build_request('testserver'))
+
+        SiteSplashConfig(host='example.org', enabled=False).save()
+        assert not get_snapshot(self.build_request('example.org')).enabled
+        assert get_snapshot(self.build_request('example.org')) is not example_snapshot
+        assert get_snapshot(self.build_request('testserver')) is testserver_snapshot
+
+
+@override_settings(SPLASH_INSTRUMENTATION='test_utils.instrumentation.hook')
+class WarmUpTestCase(TestCase):
+    """
+    Tests for the warm-up of the snapshots
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        invalidate_snapshot()
+        hook.reset_mock()
+
+    @override_settings(SPLASH_WARM_UP=True)
+    def test_first_request(self):
+        """
+        With warm-up, the first request neither fetches the configuration nor compiles matchers
+        """
+        SplashConfig(enabled=True, unaffected_url_paths='/api/*,/*/xblock/*').save()
+        splash_middleware = SplashMiddleware(Mock())
+        node = get_snapshot().path_matcher.root.children['']
+        assert node.regex is not None
+        assert node.children['api'].regex is not None
+        request = RequestFactory(SERVER_NAME='example.org').get('/somewhere')
+        request.user = AnonymousUser()
+
+        with self.assertNumQueries(0):
+            assert splash_middleware.process_request(request).status_code == 302
+        assert hook.call_args_list[0].args[0] == 'splash.config_fetch'
+        assert hook.call_args_list[0].args[2] == {'source': 'snapshot'}
+
+    def test_no_warm_up(self):
+        """
+        Warm-up is disabled by default
+        """
+        SplashConfig(enabled=True).save()
+        SplashMiddleware(Mock())
+
+        assert _store.snapshot is None
+
+    @override_settings(SPLASH_WARM_UP=True)
+    def test_database_unreachable(self):
+        """
+        Warm-up fails soft when the database can't be reached
+        """
+        with patch.object(SplashConfig, 'current', side_effect=OperationalError('unreachable')):
+            with self.assertLogs('splash.snapshot', 'WARNING'):
+                splash_middleware = SplashMiddleware(Mock())
+            assert not warm_up()
+
+        assert _store.snapshot is None
+        request = RequestFactory(SERVER_NAME='example.org').get('/somewhere')
+        request.user = AnonymousUser()
+        assert splash_middleware.process_request(request) is None
+
+    @override_settings(SPLASH_WARM_UP=True)
+    def test_build_error(self):
+        """
+        Warm-up fails soft when the snapshots can't be built
+        """
+        SplashConfig(enabled=True).save()
+        with patch('splash.snapshot.SplashSnapshot', side_effect=RuntimeError('broken')):
+            with self.assertLogs('splash.snapshot', 'ERROR'):
+                SplashMiddleware(Mock())
+        assert _store.snapshot is None
+
+    def test_connections_closed(self):
+        """
+        The connections opened by warm-up aren't left open for forked processes to share
+        """
+        with patch('splash.snapshot.connections') as connections:
+            assert warm_up()
+        connections.close_all.assert_called_once_with()
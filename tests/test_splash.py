@@ -3,13 +3,16 @@ Splash - Tests
 """
 
 import logging
-from unittest.mock import Mock
+import time
+from datetime import timedelta
+from unittest.mock import Mock, patch
 
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import AnonymousUser, Group
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from django.utils import timezone
 
 from splash.middleware import SplashMiddleware
 from splash.models import SplashConfig
@@ -66,6 +69,54 @@ class SplashMiddlewareTestCase(TestCase):
         response = self.splash_middleware.process_request(request)
         assert response is None
 
+    def test_activation_window(self):
+        """
+        The splash screen is only active within its activation window
+        """
+        now = timezone.now()
+        SplashConfig(enabled=True, active_from=now + timedelta(minutes=1)).save()
+        assert self.splash_middleware.process_request(self.build_request()) is None
+
+        SplashConfig(
+            enabled=True,
+            active_from=now - timedelta(minutes=1),
+            active_until=now + timedelta(minutes=1),
+        ).save()
+        self.assert_redirect(self.splash_middleware.process_request(self.build_request()), 'http://edx.org')
+
+        with patch('time.time', return_value=time.time() + 60):
+            assert self.splash_middleware.process_request(self.build_request()) is None
+
+    def test_rollout_percentage(self):
+        """
+        Partial rollouts redirect a stable share of the visitors, by session, cookie or IP address
+        """
+        SplashConfig(enabled=True, rollout_percentage=30).save()
+
+        def redirects(**meta):
+            request = self.request_factory.get('/somewhere', **meta)
+            request.user = AnonymousUser()
+            return self.splash_middleware.process_request(request) is not None
+
+        by_address = [redirects(REMOTE_ADDR=f'10.0.{index // 256}.{index % 256}') for index in range(2000)]
+        assert 500 < sum(by_address) < 700
+        assert by_address[:100] == [redirects(REMOTE_ADDR=f'10.0.0.{index}') for index in range(100)]
+
+        # The session cookie takes precedence over the address
+        sessions = [redirects(HTTP_COOKIE=f'sessionid=session{index}', REMOTE_ADDR='10.0.0.1') for index in range(200)]
+        assert 0 < sum(sessions) < 200
+
+        # Raising the percentage keeps the visitors already in the rollout
+        SplashConfig(enabled=True, rollout_percentage=60).save()
+        assert all(redirects(REMOTE_ADDR=f'10.0.0.{index}') for index in range(100) if by_address[index])
+
+    def test_invalid_rollout_percentage(self):
+        """
+        Rollout percentages can't exceed 100
+        """
+        with self.assertRaises(ValidationError):
+            SplashConfig(enabled=True, rollout_percentage=101).save()
+
     def test_no_cookie(self):
         """
         No cookie present should redirect
@@ -160,6 +211,53 @@ class SplashMiddlewareTestCase(TestCase):
         response = self.splash_middleware.process_request(request)
         assert response is None
 
+    def test_unaffected_staff_and_superusers(self):
+        """
+        Staff users and superusers can be exempted
+        """
+        SplashConfig(
+            enabled=True,
+            unaffected_staff=True,
+            unaffected_superusers=True,
+        ).save()
+        staff = User.objects.create_user('staff', 'staff@example.com', 'staff', is_staff=True)
+        superuser = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+        for user in (staff, superuser):
+            request = self.build_request()
+            request.user = user
+            assert self.splash_middleware.process_request(request) is None
+
+        request = self.build_request(username='user1')
+        response = self.splash_middleware.process_request(request)
+        self.assert_redirect(response, 'http://edx.org')
+
+    def test_unaffected_groups(self):
+        """
+        Members of the unaffected groups are never redirected, without a query per request
+        """
+        SplashConfig(
+            enabled=True,
+            unaffected_groups='beta, testers',
+        ).save()
+        beta = Group.objects.create(name='beta')
+        member = User.objects.create_user('member', 'member@example.com', 'member')
+        member.groups.add(beta)
+        other = User.objects.create_user('other', 'other@example.com', 'other')
+        other.groups.add(Group.objects.create(name='others'))
+
+        request = self.build_request()
+        request.user = member
+        assert self.splash_middleware.process_request(request) is None
+
+        with self.assertNumQueries(0):
+            request = self.build_request()
+            request.user = member
+            assert self.splash_middleware.process_request(request) is None
+            request = self.build_request()
+            request.user = other
+            self.assert_redirect(self.splash_middleware.process_request(request), 'http://edx.org')
+
     def test_redirect_to_current_url(self):
         """
         When the URL of the redirection is the same as the current URL,
@@ -174,6 +272,109 @@ class SplashMiddlewareTestCase(TestCase):
         response = self.splash_middleware.process_request(request)
         assert response is None
 
+    def test_redirect_to_current_path_other_host(self):
+        """
+        When only the path of the redirection is the same as the current one,
+        we should be redirected
+        """
+        SplashConfig(
+            enabled=True,
+            redirect_url='http://example.com/somewhere'
+        ).save()
+
+        request = self.build_request()
+        response = self.splash_middleware.process_request(request)
+        self.assert_redirect(response, 'http://example.com/somewhere')
+
+    def test_redirect_to_current_url_with_query(self):
+        """
+        The query string is part of the URL compared with the redirection
+        """
+        SplashConfig(
+            enabled=True,
+            redirect_url='http://example.org/somewhere?a=1'
+        ).save()
+
+        request = self.build_request(url_path='/somewhere?a=1')
+        assert self.splash_middleware.process_request(request) is None
+
+        request = self.build_request(url_path='/somewhere?a=2')
+        response = self.splash_middleware.process_request(request)
+        self.assert_redirect(response, 'http://example.org/somewhere?a=1')
+
+    def test_redirect_without_host_check(self):
+        """
+        The absolute URL of the request isn't built when its path isn't the redirection one
+        """
+        SplashConfig(
+            enabled=True,
+            redirect_url='http://example.org/splash'
+        ).save()
+
+        request = self.build_request()
+        with patch.object(request, 'build_absolute_uri') as build_absolute_uri:
+            response = self.splash_middleware.process_request(request)
+        self.assert_redirect(response, 'http://example.org/splash')
+        assert not build_absolute_uri.called
+
+    def test_redirect_caching_headers(self):
+        """
+        Redirects vary on cookies, and don't get other caching headers by default
+        """
+        SplashConfig(enabled=True).save()
+
+        response = self.splash_middleware.process_request(self.build_request())
+        assert response['Vary'] == 'Cookie'
+        assert 'Cache-Control' not in response
+
+    @override_settings(
+        SPLASH_REDIRECT_CACHE_CONTROL={'public': True, 'max_age': 60},
+        SPLASH_EXEMPTION_HINT_HEADER='X-Splash-Exemption-Cookies',
+    )
+    def test_redirect_edge_caching(self):
+        """
+        Redirects get the configured Cache-Control and exemption hint headers
+        """
+        SplashConfig(enabled=True, cookie_name='othername').save()
+        splash_middleware = SplashMiddleware(self.mock_response)
+
+        response = splash_middleware.process_request(self.build_request())
+        assert response['Vary'] == 'Cookie'
+        assert response['Cache-Control'] == 'public, max-age=60'
+        assert response['X-Splash-Exemption-Cookies'] == 'othername'
+
+        SplashConfig(enabled=True, unaffected_usernames='user1').save()
+        response = splash_middleware.process_request(self.build_request())
+        assert response['X-Splash-Exemption-Cookies'] == 'edx_splash_screen, sessionid'
+
+        # Partial rollouts don't depend on the cookies only
+        SplashConfig(enabled=True, rollout_percentage=99).save()
+        response = splash_middleware.process_request(self.build_request())
+        assert response['Cache-Control'] == 'private, no-store'
+        assert 'X-Splash-Exemption-Cookies' not in response
+
+    @override_settings(SPLASH_REDIRECT_CACHE_CONTROL={'public': True, 'max_age': 600, 's_maxage': 300})
+    def test_redirect_caching_until_transition(self):
+        """
+        Redirects aren't cached past the end of the activation window
+        """
+        active_until = timezone.now() + timedelta(seconds=120)
+        now = active_until.timestamp() - 120
+        SplashConfig(enabled=True, active_until=active_until).save()
+        splash_middleware = SplashMiddleware(self.mock_response)
+
+        with patch('time.time', return_value=now):
+            response = splash_middleware.process_request(self.build_request())
+        assert response['Cache-Control'] == 'public, max-age=120, s-maxage=120'
+
+        with patch('time.time', return_value=now + 119.5):
+            response = splash_middleware.process_request(self.build_request())
+        assert response['Cache-Control'] == 'public, max-age=0, s-maxage=0'
+
+        SplashConfig(enabled=True).save()
+        response = splash_middleware.process_request(self.build_request())
+        assert response['Cache-Control'] == 'public, max-age=600, s-maxage=300'
+
     def test_set_non_absolute_url(self):
         """
         Make sure the URL is absolute, to make sure we can compare it
@@ -0,0 +1,64 @@
+"""
+Splash - Signed cookie token tests
+"""
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from splash.tokens import TokenVerifier, issue_token
+
+
+class TokenVerifierTestCase(SimpleTestCase):
+    """
+    Tests for the signed cookie tokens
+    """
+
+    def test_valid_token(self):
+        """
+        Issued tokens are valid until they expire
+        """
+        token = issue_token('edx_splash_screen')
+        verifier = TokenVerifier('edx_splash_screen', 60)
+
+        assert verifier.verify(token)
+        with patch('time.time', return_value=time.time() + 61):
+            assert not verifier.verify(token)
+            assert not TokenVerifier('edx_splash_screen', 60).verify(token)
+
+    def test_invalid_tokens(self):
+        """
+        Tampered tokens, tokens of other cookies and plain values are rejected
+        """
+        token = issue_token('edx_splash_screen')
+        verifier = TokenVerifier('edx_splash_screen', 60)
+
+        assert not verifier.verify(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+        assert not verifier.verify(issue_token('othername'))
+        assert not verifier.verify('seen')
+        assert not verifier.verify('')
+        assert not verifier.verify(None)
+
+    def test_verified_once(self):
+        """
+        Verified tokens are cached, invalid ones aren't
+        """
+        token = issue_token('edx_splash_screen')
+        verifier = TokenVerifier('edx_splash_screen', 60)
+
+        with patch.object(verifier.signer, 'unsign', wraps=verifier.signer.unsign) as unsign:
+            for _ in range(3):
+                assert verifier.verify(token)
+                assert not verifier.verify('seen')
+        assert unsign.call_count == 4
+        assert verifier.verified.info()['size'] == 1
+
+    @override_settings(SPLASH_VERIFIED_TOKENS_CACHE_SIZE=0)
+    def test_no_cache(self):
+        """
+        The cache of verified tokens can be disabled
+        """
+        verifier = TokenVerifier('edx_splash_screen', 60)
+
+        assert verifier.verified is None
+        assert verifier.verify(issue_token('edx_splash_screen'))
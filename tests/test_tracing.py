@@ -0,0 +1,208 @@
+"""
+Splash - Decision tracing tests
+"""
+import json
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from edx_django_utils.cache import TieredCache
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.urls import reverse
+
+from splash.middleware import SplashMiddleware
+from splash.models import SplashConfig
+from splash.snapshot import invalidate_snapshot
+from splash.tracing import Tracer, get_tracer
+from test_utils.instrumentation import hook
+
+User = get_user_model()
+
+
+@override_settings(SPLASH_TRACE_SAMPLE_RATE=1, SPLASH_TRACE_BUFFER_SIZE=3)
+class TracingTestCase(TestCase):
+    """
+    Tests for the decision traces of the splash middleware
+    """
+
+    def setUp(self):
+        super().setUp()
+        TieredCache.dangerous_clear_all_tiers()
+        invalidate_snapshot()
+        get_tracer().clear()
+        self.request_factory = RequestFactory(SERVER_NAME='example.org')
+
+    def build_request(self, url_path='/somewhere', cookies=None):
+        """
+        Return an anonymous request for `url_path`
+        """
+        request = self.request_factory.get(url_path)
+        request.user = AnonymousUser()
+        if cookies is not None:
+            request.COOKIES = cookies
+        return request
+
+    def test_phases_and_outcomes(self):
+        """
+        Each request records the phases it went through and its outcome
+        """
+        config = SplashConfig(enabled=True, unaffected_url_paths='/api/*')
+        config.save()
+        middleware = SplashMiddleware(Mock())
+
+        assert middleware.process_request(self.build_request()).status_code == 302
+        assert middleware.process_request(self.build_request('/api/x')) is None
+        assert middleware.process_request(self.build_request(cookies={'edx_splash_screen': 'seen'})) is None
+
+        redirect, exempt_path, cookie_ok = get_tracer().dump()
+        assert redirect['outcome'] == 'redirect'
+        assert redirect['source'] == 'db'
+        assert redirect['revision'] == config.pk
+        assert redirect['path'] == '/somewhere'
+        assert list(redirect['phases']) == [
+            'config_fetch', 'activation', 'path_match', 'cookie_check', 'redirect_url', 'user', 'response',
+        ]
+        assert redirect['total'] == sum(redirect['phases'].values())
+        assert exempt_path['outcome'] == 'exempt-path'
+        assert list(exempt_path['phases']) == ['config_fetch', 'activation', 'path_match']
+        assert cookie_ok['outcome'] == 'cookie-ok'
+        assert cookie_ok['source'] == 'snapshot'
+
+    def test_rollout(self):
+        """
+        The rollout phase is only recorded for configurations with a rollout
+        """
+        SplashConfig(enabled=True, rollout_percentage=0).save()
+        SplashMiddleware(Mock()).process_request(self.build_request())
+
+        trace = get_tracer().dump()[0]
+        assert trace['outcome'] == 'sampled-out'
+        assert list(trace['phases'])[-1] == 'rollout'
+
+    def test_ring_buffer(self):
+        """
+        Only the last traces are kept
+        """
+        SplashConfig(enabled=False).save()
+        middleware = SplashMiddleware(Mock())
+        for url_path in ('/1', '/2', '/3', '/4'):
+            middleware.process_request(self.build_request(url_path))
+
+        assert [trace['path'] for trace in get_tracer().dump()] == ['/2', '/3', '/4']
+
+    @override_settings(SPLASH_INSTRUMENTATION='test_utils.instrumentation.hook')
+    def test_instrumentation(self):
+        """
+        Traced requests are reported to the instrumentation hook too
+        """
+        hook.reset_mock()
+        SplashConfig(enabled=True).save()
+        SplashMiddleware(Mock()).process_request(self.build_request())
+
+        assert [(call.args[0], call.args[2]) for call in hook.call_args_list] == [
+            ('splash.config_fetch', {'source': 'db'}),
+            ('splash.decision', {'outcome': 'redirect'}),
+        ]
+
+    async def test_async(self):
+        """
+        Async requests are traced too
+        """
+        await SplashMiddleware(Mock()).aprocess_request(self.build_request())
+        assert get_tracer().dump()[0]['outcome'] == 'disabled'
+
+    @override_settings(SPLASH_TRACE_SAMPLE_RATE=0.5)
+    def test_sampling(self):
+        """
+        Only the sampled share of the requests is traced
+        """
+        middleware = SplashMiddleware(Mock())
+        with patch('random.random', side_effect=[0.4, 0.6]):
+            middleware.process_request(self.build_request('/sampled'))
+            middleware.process_request(self.build_request('/not-sampled'))
+
+        assert [trace['path'] for trace in get_tracer().dump()] == ['/sampled']
+
+    @override_settings(SPLASH_TRACE_SAMPLE_RATE=0)
+    def test_disabled(self):
+        """
+        Without sampling, the middleware has no tracer
+        """
+        assert get_tracer() is None
+        assert SplashMiddleware(Mock()).tracer is None
+
+    def test_view(self):
+        """
+        Staff users can read the traces of the process
+        """
+        User.objects.create_user('staff', password='1234', is_staff=True)
+        User.objects.create_user('user', password='1234')
+        get_tracer().record(get_tracer().start(self.build_request()))
+
+        self.client.login(username='staff', password='1234')
+        response = self.client.get(reverse('splash:traces'))
+        assert response.status_code == 200
+        assert response.json()['sample_rate'] == 1
+        # The request for the traces got traced too
+        assert [trace['path'] for trace in response.json()['traces']] == ['/somewhere', '/splash/traces/']
+
+        self.client.login(username='user', password='1234')
+        assert self.client.get(reverse('splash:traces')).status_code == 403
+        with override_settings(SPLASH_TRACE_SAMPLE_RATE=0):
+            self.client.login(username='staff', password='1234')
+            assert self.client.get(reverse('splash:traces')).status_code == 404
+        self.client.logout()
+        assert self.client.get(reverse('splash:traces')).status_code == 403
+
+
+class TraceCommandTestCase(TestCase):
+    """
+    Tests for the splash_trace management command
+    """
+
+    def call_command(self, *args):
+        """
+        Run the command, returning its output
+        """
+        out = StringIO()
+        call_command('splash_trace', *args, stdout=out)
+        return out.getvalue()
+
+    def test_summary(self):
+        """
+        The summary counts the outcomes and the phases of the requests
+        """
+        SplashConfig(enabled=True, unaffected_url_paths='/api/*').save()
+        output = self.call_command('/somewhere', '/api/x', '--requests', '5')
+
+        counts = {line.split()[0]: line.split()[1] for line in output.splitlines() if line.startswith('  ')}
+        assert counts['redirect'] == counts['exempt-path'] == counts['user'] == '5'
+        assert counts['path_match'] == counts['total'] == '10'
+
+    def test_json(self):
+        """
+        The traces can be dumped as JSON, for requests with a cookie or a user
+        """
+        SplashConfig(enabled=True, unaffected_usernames='user1').save()
+        User.objects.create_user('user1')
+
+        traces = json.loads(self.call_command('--requests', '2', '--cookie', 'seen', '--json'))
+        assert [trace['outcome'] for trace in traces] == ['cookie-ok', 'cookie-ok']
+        traces = json.loads(self.call_command('--requests', '1', '--username', 'user1', '--json'))
+        assert traces[0]['outcome'] == 'exempt-user'
+
+        with self.assertRaises(CommandError):
+            self.call_command('--username', 'unknown')
+
+    def test_tracer_buffer(self):
+        """
+        The tracer keeps every trace up to its buffer size
+        """
+        tracer = Tracer(1, 2)
+        for _ in range(3):
+            tracer.record(tracer.start(RequestFactory().get('/')))
+        assert len(tracer.dump()) == 2
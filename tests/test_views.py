@@ -3,11 +3,13 @@ Tests for views which will trigger the middleware automatically.
 """
 from http import cookies
 
+from edx_django_utils.cache import TieredCache
+
 from django.contrib.auth import get_user_model
 from django.test.testcases import TestCase
 from django.urls import reverse
 
-from splash.models import SplashConfig
+from splash.models import SiteSplashConfig, SplashConfig
 
 PASSWORD = '1234'
 User = get_user_model()
@@ -163,6 +165,79 @@ class ViewsTestCase(TestCase):
         response = self.client.get(self.home_url)
         self.assert_redirect(response, 'http://edx.org')
 
+    def test_right_cookie_no_queries(self):
+        """
+        With the right cookie, neither the session nor the user get loaded
+        """
+        SplashConfig(
+            enabled=True,
+            unaffected_usernames='user1',
+        ).save()
+
+        user = User.objects.create_user('user2', 'test@example.com', PASSWORD)
+        self.client.login(username=user.username, password=PASSWORD)
+        self.client.cookies['edx_splash_screen'] = 'seen'
+        # Build the configuration snapshot
+        self.assert_no_redirect()
+
+        with self.assertNumQueries(0):
+            self.assert_no_redirect()
+
+    def test_site_config(self):
+        """
+        The configuration of the site of the request takes precedence over the global one
+        """
+        SplashConfig(enabled=False).save()
+        SiteSplashConfig(
+            host='testserver',
+            enabled=True,
+            redirect_url='http://example.com',
+        ).save()
+        self.addCleanup(TieredCache.dangerous_clear_all_tiers)
+
+        response = self.client.get(self.home_url)
+        self.assert_redirect(response, 'http://example.com')
+
+    def test_accept_signed_cookie(self):
+        """
+        The accept view issues a signed cookie value letting the next requests through
+        """
+        SplashConfig(
+            enabled=True,
+            signed_cookie=True,
+            signed_cookie_max_age=3600,
+            unaffected_url_paths='/splash/accept/',
+        ).save()
+        self.assert_redirect(self.client.get(self.home_url), 'http://edx.org')
+
+        response = self.client.get(reverse('splash:accept'), {'next': self.home_url})
+        self.assert_redirect(response, self.home_url)
+        cookie = response.cookies['edx_splash_screen']
+        assert cookie.value != 'seen'
+        assert cookie['max-age'] == 3600
+        assert cookie['httponly']
+        self.assert_no_redirect()
+
+        self.client.cookies['edx_splash_screen'] = cookie.value[:-1]
+        self.assert_redirect(self.client.get(self.home_url), 'http://edx.org')
+
+    def test_accept_unsafe_next(self):
+        """
+        The accept view only redirects to URLs of the site
+        """
+        SplashConfig(enabled=True, signed_cookie=True, unaffected_url_paths='/splash/accept/').save()
+
+        response = self.client.get(reverse('splash:accept'), {'next': 'http://evil.example.com/'})
+        self.assert_redirect(response, '/')
+
+    def test_accept_without_signed_cookie(self):
+        """
+        The accept view is only available when signed cookie values are enabled
+        """
+        SplashConfig(enabled=True, unaffected_url_paths='/splash/accept/').save()
+
+        assert self.client.get(reverse('splash:accept')).status_code == 404
+
     def assert_no_redirect(self):
         """
         Check that the response redirects to `redirect_url`, without requiring client